@@ -1,11 +1,23 @@
+import codecs
 import datetime
 import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
 
+import http_client
+import token_cache
+
 AUTH_URL = 'https://www.humanity.com/oauth2/token.php'
 API_BASE_URL = 'https://www.humanity.com/api/v2'
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Tokens handed out by get_access_token, so a token the API rejects can be replaced
+_token_sources: dict = {}
+_token_lock = threading.Lock()
 
 
 # Function to handle error response from API
@@ -21,9 +33,75 @@ def get_access_token(credentials_file: Path) -> str:
     with open(credentials_file) as json_file:
         credentials = json.load(json_file)
 
-    response = requests.post(url=AUTH_URL, data=credentials)
-    handle_api_error(response)
-    return json.loads(response.text).get('access_token')
+    def fetch_token() -> dict:
+        response = http_client.post(AUTH_URL, data=credentials)
+        handle_api_error(response)
+        return json.loads(response.text)
+
+    # Reuse the cached token until shortly before it expires
+    key = token_cache.cache_key('humanity', credentials)
+    access_token = token_cache.get_token(key, fetch_token)
+    if access_token:
+        with _token_lock:
+            _token_sources.setdefault(access_token, {
+                'key': key,
+                'fetch': fetch_token,
+                'lock': threading.Lock()
+            })
+    return access_token
+
+
+# Function to follow a token to the one that replaced it after a 401
+def _current_token(access_token: str) -> str:
+    with _token_lock:
+        source = _token_sources.get(access_token)
+        while source and source.get('renewed'):
+            access_token = source['renewed']
+            source = _token_sources.get(access_token)
+    return access_token
+
+
+# Function to drop a rejected token from the cache and fetch a new one, once per token
+def _renew_token(access_token: str) -> str | None:
+    with _token_lock:
+        source = _token_sources.get(access_token)
+    if source is None:
+        return None
+    # Only callers holding the same rejected token wait for the renewal
+    with source['lock']:
+        if 'renewed' not in source:
+            token_cache.invalidate(source['key'])
+            try:
+                renewed = token_cache.get_token(source['key'], source['fetch'])
+            except Exception as error:
+                print(f'Failed to renew the access token. Error: {error}')
+                renewed = None
+            if renewed:
+                with _token_lock:
+                    _token_sources.setdefault(renewed, {
+                        'key': source['key'],
+                        'fetch': source['fetch'],
+                        'lock': threading.Lock()
+                    })
+            source['renewed'] = renewed
+        return source['renewed']
+
+
+# Function to send an authenticated GET, a token rejected with 401 is renewed and the request sent once more
+def _api_get(url: str, params: dict, **kwargs) -> requests.Response:
+    params = {**params, 'access_token': _current_token(params['access_token'])}
+    response = http_client.get(url, params=params, **kwargs)
+    if response.status_code == 401:
+        access_token = _renew_token(params['access_token'])
+        if access_token:
+            response.close()
+            response = http_client.get(url,
+                                       params={
+                                           **params,
+                                           'access_token': access_token
+                                       },
+                                       **kwargs)
+    return response
 
 
 def get_positions(access_token: str) -> dict | None:
@@ -33,7 +111,7 @@ def get_positions(access_token: str) -> dict | None:
     params = {'access_token': access_token}
 
     # Get position data
-    response = requests.get(url, headers=headers, params=params)
+    response = _api_get(url, params, headers=headers)
     if response.status_code == 200:
         position_data = response.json().get('data')
         positions_dict = {}
@@ -54,11 +132,81 @@ def get_positions(access_token: str) -> dict | None:
         return None
 
 
+def get_employees(access_token: str) -> dict | None:
+    # Construct API URL
+    url = f'{API_BASE_URL}/employees'
+    headers = {'accept': 'application/json'}
+    params = {'access_token': access_token}
+
+    # Get employee data
+    response = _api_get(url, params, headers=headers)
+    if response.status_code == 200:
+        employee_data = response.json().get('data')
+        employees_dict = {}
+        for index, employee in enumerate(employee_data):
+            employees_dict[index] = {
+                'id': str(employee.get('id')),
+                'name': employee.get('name'),
+                'email': employee.get('email')
+            }
+        return employees_dict
+    else:
+        print(
+            f'Failed to retrieve employees. Status code: {response.status_code}')
+        return None
+
+
+# Function to split an inclusive date range into consecutive windows
+def _date_windows(start_date: datetime.date, end_date: datetime.date,
+                  window_days: int) -> list[tuple]:
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(window_start + datetime.timedelta(days=window_days - 1),
+                         end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end + datetime.timedelta(days=1)
+    return windows
+
+
+# Function to fetch a single date window, transient failures are retried for this window only
+def _fetch_shifts_window(url: str, headers: dict, params: dict,
+                         retries: int) -> dict | None:
+    try:
+        response = _api_get(url,
+                            params,
+                            headers=headers,
+                            max_retries=retries)
+    except requests.RequestException as error:
+        print(f'Failed to retrieve shifts for {params["start_date"]} to '
+              f'{params["end_date"]}. Error: {error}')
+        return None
+    if response.status_code == 200:
+        return response.json()
+    print(f'Failed to retrieve shifts for {params["start_date"]} to '
+          f'{params["end_date"]}. Status code: {response.status_code}')
+    return None
+
+
+# Function to merge window responses and drop shifts returned by more than one window
+def _merge_shift_windows(responses: list[dict]) -> dict:
+    merged = dict(responses[0])
+    shifts = {}
+    for response in responses:
+        for shift in response.get('data') or []:
+            shifts.setdefault(shift['id'], shift)
+    merged['data'] = list(shifts.values())
+    return merged
+
+
 def get_shifts(start_date: datetime.date,
                end_date: datetime.date,
                access_token: str,
                positions: dict = {},
-               mode: str = 'overview') -> dict | None:
+               mode: str = 'overview',
+               window_days: int | None = None,
+               max_workers: int = 4,
+               retries: int = 3) -> dict | None:
     # Construct API URL
     url = f'{API_BASE_URL}/shifts'
     headers = {'accept': 'application/json'}
@@ -73,11 +221,109 @@ def get_shifts(start_date: datetime.date,
     if positions:
         params['schedule'] = ', '.join(positions.keys())
 
+    # Fetch the range in windows concurrently over the shared connection pool
+    if window_days:
+        windows = _date_windows(start_date, end_date, window_days)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(
+                executor.map(
+                    lambda window: _fetch_shifts_window(
+                        url, headers, {
+                            **params, 'start_date': str(window[0]),
+                            'end_date': str(window[1])
+                        }, retries), windows))
+        if any(response is None for response in responses):
+            return None
+        return _merge_shift_windows(responses)
+
     # Get shift data
-    response = requests.get(url, headers=headers, params=params)
+    response = _api_get(url, params, headers=headers)
     if response.status_code == 200:
         return response.json()
     else:
         print(
             f'Failed to retrieve shifts. Status code: {response.status_code}')
         return None
+
+
+# Function to yield the items of a top level JSON array while the body is still downloading
+def _iter_json_array(chunks, key: str = 'data'):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    buffer = ''
+    in_array = False
+    chunks = iter(chunks)
+    while True:
+        if not in_array:
+            match = array_start.search(buffer)
+            if match:
+                in_array = True
+                buffer = buffer[match.end():]
+                continue
+        else:
+            buffer = buffer.lstrip(' \t\r\n,')
+            if buffer.startswith(']'):
+                return
+            if buffer:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    pass  # Item is incomplete, read more
+                else:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+        chunk = next(chunks, None)
+        if chunk is None:
+            if in_array:
+                raise ValueError('Shifts response ended inside the data array')
+            return
+        buffer += text_decoder.decode(chunk)
+
+
+def iter_shifts(start_date: datetime.date,
+                end_date: datetime.date,
+                access_token: str,
+                positions: dict = {},
+                mode: str = 'overview',
+                window_days: int = 7):
+    '''Yield shifts of the range one by one, fetching one date window at a time
+
+    Each window response is streamed and parsed incrementally, so memory holds
+    a single shift plus the ids already seen, not the whole period.
+
+    Args:
+        start_date (datetime.date): Start of the period
+        end_date (datetime.date): End of the period, inclusive
+        access_token (str): Humanity access token
+        positions (dict): Optional schedule filter
+        mode (str): Humanity shifts mode
+        window_days (int): Days fetched per request
+
+    Yields:
+        dict: Shift in the same shape as get_shifts()['data'] items
+    '''
+    url = f'{API_BASE_URL}/shifts'
+    headers = {'accept': 'application/json'}
+    params = {'mode': mode, 'access_token': access_token}
+    if positions:
+        params['schedule'] = ', '.join(positions.keys())
+
+    # Shifts spanning a window boundary can be returned twice
+    seen_ids = set()
+    for window_start, window_end in _date_windows(start_date, end_date,
+                                                  window_days):
+        response = _api_get(url, {
+            **params, 'start_date': str(window_start),
+            'end_date': str(window_end)
+        },
+                            headers=headers,
+                            stream=True)
+        with response:
+            handle_api_error(response)
+            for shift in _iter_json_array(
+                    response.iter_content(chunk_size=STREAM_CHUNK_SIZE)):
+                if shift['id'] not in seen_ids:
+                    seen_ids.add(shift['id'])
+                    yield shift
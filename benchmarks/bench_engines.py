@@ -0,0 +1,69 @@
+import argparse
+import contextlib
+import io
+import time
+from pathlib import Path
+
+import report_generator
+from benchmarks.bench_report import DEFAULT_SIZES, SELECT_POSITIONS
+from benchmarks.synthetic import generate_shifts_payload
+from calendar_rules import compile_rules, load_rules
+
+
+def run_engine(engine: str, payload: dict, calendar: dict | None) -> tuple:
+    '''Build the shift and standby reports with engine, return both as csv text and the wall time'''
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        shift_report = report_generator.generate_shift_report(
+            payload, None, calendar, engine=engine)
+        standby_report = report_generator.generate_standby_report(
+            shift_report, SELECT_POSITIONS)
+    seconds = time.perf_counter() - started
+    return (report_generator.as_pandas(shift_report).to_csv(index=False),
+            standby_report.to_csv(index=False), seconds)
+
+
+def compare_engines(shifts: int, calendar: dict | None) -> list[str]:
+    '''Run every engine on the same payload, return a line per report that differs from pandas'''
+    payload = generate_shifts_payload(shifts, employees_per_shift=2)
+    reference = None
+    mismatches = []
+    for engine in report_generator.ENGINES:
+        shift_csv, standby_csv, seconds = run_engine(engine, payload,
+                                                     calendar)
+        print(f'{engine:8} {shifts:>9} shifts {seconds:9.3f}s')
+        if reference is None:
+            reference = shift_csv, standby_csv
+            continue
+        if shift_csv != reference[0]:
+            mismatches.append(f'{engine} shift report differs at {shifts} shifts')
+        if standby_csv != reference[1]:
+            mismatches.append(f'{engine} standby report differs at {shifts} shifts')
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check that every engine builds the same reports as pandas and compare their timings')
+    parser.add_argument('--sizes',
+                        nargs='*',
+                        type=int,
+                        default=DEFAULT_SIZES,
+                        help='Numbers of shifts to compare')
+    parser.add_argument('--calendar_rules',
+                        type=Path,
+                        default=None,
+                        help='Also compare with these calendar rules')
+    args = parser.parse_args()
+
+    calendars = [None]
+    if args.calendar_rules:
+        calendars.append(compile_rules(load_rules(args.calendar_rules)))
+    mismatches = []
+    for calendar in calendars:
+        print('Calendar rules' if calendar else 'Default rules')
+        for size in args.sizes:
+            mismatches += compare_engines(size, calendar)
+    if mismatches:
+        raise SystemExit('Engine mismatches:\n' + '\n'.join(mismatches))
+    print('All engines match')
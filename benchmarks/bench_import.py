@@ -0,0 +1,123 @@
+import argparse
+import datetime
+import platform
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.common import git_commit, save_results
+
+ROOT = Path(__file__).resolve().parent.parent
+# Modules main must not import before the arguments are parsed
+HEAVY_MODULES = ['pandas', 'numpy', 'requests', 'urllib3', 'pyarrow', 'polars']
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def import_times(module: str = 'main') -> dict:
+    '''Import module in a fresh interpreter with -X importtime
+
+    Returns:
+        dict: Cumulative microseconds of module and each module it imported
+    '''
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True)
+    # Nested imports are listed before their parent, interpreter startup
+    # (site) comes first and ends with a top level line of its own
+    times = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        times[match[4]] = int(match[2])
+        if not match[3] and match[4] != module:
+            times = {}
+    return times
+
+
+def help_seconds() -> float:
+    '''Wall time of python main.py --help including interpreter startup'''
+    started = time.perf_counter()
+    subprocess.run([sys.executable, 'main.py', '--help'],
+                   cwd=ROOT,
+                   capture_output=True,
+                   check=True)
+    return time.perf_counter() - started
+
+
+def run(repeat: int) -> dict:
+    '''Best of repeat cold starts, with the slowest imports of the best run'''
+    best = None
+    for _ in range(repeat):
+        times = import_times()
+        if best is None or times['main'] < best['main']:
+            best = times
+    seconds = min(help_seconds() for _ in range(repeat))
+
+    heavy = sorted(
+        module for module in best
+        if module.split('.')[0] in HEAVY_MODULES and '.' not in module)
+    slowest = sorted(((module, micros) for module, micros in best.items()
+                      if module != 'main'),
+                     key=lambda item: item[1],
+                     reverse=True)[:10]
+    print(f'import main {best["main"] / 1000:9.1f} ms')
+    print(f'main --help {seconds * 1000:9.1f} ms')
+    for module, micros in slowest:
+        print(f'  {module:40} {micros / 1000:9.1f} ms')
+    return {
+        'import_ms': round(best['main'] / 1000, 2),
+        'help_ms': round(seconds * 1000, 2),
+        'heavy_modules': heavy,
+        'slowest': slowest
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Guard the cold start time of main.py')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=5,
+                        help='Cold starts per measurement, the best one is kept')
+    parser.add_argument('--max_import_ms',
+                        type=float,
+                        default=150.0,
+                        help='Budget for importing main')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=1.5,
+                        help='Slowdown ratio against the previous run counted as a regression')
+    args = parser.parse_args()
+
+    current = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        **run(args.repeat)
+    }
+
+    previous_name, previous = save_results('import', current)
+
+    regressions = []
+    if current['heavy_modules']:
+        regressions.append('main imports ' +
+                           ', '.join(current['heavy_modules']) +
+                           ' at startup')
+    if current['import_ms'] > args.max_import_ms:
+        regressions.append(f'import main takes {current["import_ms"]} ms, '
+                           f'budget is {args.max_import_ms} ms')
+    if previous:
+        ratio = current['import_ms'] / max(previous['import_ms'], 0.01)
+        print(f'Compared with {previous_name}: '
+              f'{previous["import_ms"]} ms -> {current["import_ms"]} ms '
+              f'({ratio:.2f}x)')
+        if ratio > args.threshold:
+            regressions.append(f'import main is {ratio:.2f}x slower')
+    if regressions:
+        raise SystemExit('Regressions:\n' + '\n'.join(regressions))
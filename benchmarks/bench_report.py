@@ -0,0 +1,181 @@
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import report_generator
+from benchmarks.common import git_commit, save_results
+from benchmarks.synthetic import POSITIONS, generate_shifts_payload
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+SELECT_POSITIONS = list(POSITIONS)[:6]
+
+
+def _measure(function, *args, repeat: int = 1) -> tuple:
+    '''Run function for the best wall and CPU time of repeat runs, then once under tracemalloc for peak memory'''
+    seconds = cpu_seconds = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args)
+        cpu_seconds = min(cpu_seconds, time.process_time() - cpu_started)
+        seconds = min(seconds, time.perf_counter() - started)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, cpu_seconds, peak / 2**20
+
+
+def _payload_mib(payload: dict) -> float:
+    return len(json.dumps(payload).encode()) / 2**20
+
+
+# Function to build the standby report the way main.py does, from the payload to the totals
+def _standby_report(payload: dict, select_positions) -> pd.DataFrame:
+    shift_report = report_generator.generate_shift_report(payload,
+                                                          select_positions,
+                                                          verbose=False)
+    return report_generator.generate_standby_report(shift_report,
+                                                    SELECT_POSITIONS)
+
+
+def run_size(shifts: int, reference_max_rows: int,
+             repeat: int) -> list[dict]:
+    payload = generate_shifts_payload(shifts)
+    shift_report, _, _, _ = _measure(report_generator.generate_shift_report,
+                                     payload)
+    rows = len(shift_report)
+    starts, ends = shift_report['Start_date'], shift_report['End_date']
+
+    cases = [
+        ('parse_data_columnar', report_generator.parse_data_columnar,
+         (payload, )),
+        ('separate_hours_vectorized',
+         report_generator.separate_hours_vectorized, (starts, ends)),
+        ('generate_shift_report', report_generator.generate_shift_report,
+         (payload, )),
+        ('generate_standby_report', report_generator.generate_standby_report,
+         (shift_report, SELECT_POSITIONS)),
+    ]
+    # main.py asks the API for the selected positions only and parses only
+    # those, the unfiltered case is the full payload reduced at aggregation
+    filtered = {
+        **payload, 'data': [
+            shift for shift in payload['data']
+            if shift['schedule'] in SELECT_POSITIONS
+        ]
+    }
+    payload_mib = {
+        'standby_report_unfiltered': _payload_mib(payload),
+        'standby_report_filtered': _payload_mib(filtered)
+    }
+    cases += [
+        ('standby_report_unfiltered', _standby_report, (payload, None)),
+        ('standby_report_filtered', _standby_report,
+         (filtered, SELECT_POSITIONS)),
+    ]
+    # The per-row reference implementations take minutes at a million rows
+    if rows <= reference_max_rows:
+        cases += [
+            ('parse_data', report_generator.parse_data, (payload, )),
+            ('separate_hours', report_generator.separate_hours,
+             (starts, ends)),
+        ]
+
+    results = []
+    for name, function, args in cases:
+        _, seconds, cpu_seconds, peak_mib = _measure(function,
+                                                     *args,
+                                                     repeat=repeat)
+        result = {
+            'name': name,
+            'shifts': shifts,
+            'rows': rows,
+            'seconds': round(seconds, 4),
+            'cpu_seconds': round(cpu_seconds, 4),
+            'peak_mib': round(peak_mib, 2)
+        }
+        line = (f'{name:28} {rows:>9} rows {seconds:9.3f}s '
+                f'{cpu_seconds:9.3f}s cpu {peak_mib:9.1f} MiB')
+        if name in payload_mib:
+            result['payload_mib'] = round(payload_mib[name], 2)
+            line += f' {payload_mib[name]:9.1f} MiB payload'
+        results.append(result)
+        print(line)
+    return results
+
+
+def compare(previous: dict, current: dict, threshold: float) -> list[str]:
+    '''Return a line for every case that got slower than threshold times the previous run'''
+    baseline = {(result['name'], result['shifts']): result
+                for result in previous['results']}
+    regressions = []
+    for result in current['results']:
+        before = baseline.get((result['name'], result['shifts']))
+        if not before or not before['seconds']:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        print(f'{result["name"]:28} {result["shifts"]:>9} shifts '
+              f'{before["seconds"]:9.3f}s -> {result["seconds"]:9.3f}s '
+              f'({ratio:.2f}x)')
+        if ratio > threshold:
+            regressions.append(f'{result["name"]} at {result["shifts"]} '
+                               f'shifts is {ratio:.2f}x slower')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the report pipeline on synthetic shifts')
+    parser.add_argument('--sizes',
+                        nargs='*',
+                        type=int,
+                        default=DEFAULT_SIZES,
+                        help='Numbers of shifts to benchmark')
+    parser.add_argument('--reference_max_rows',
+                        type=int,
+                        default=100_000,
+                        help='Skip the per-row reference functions above this')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=3,
+                        help='Timing runs per case, the best one is kept')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=1.25,
+                        help='Slowdown ratio against the previous run counted as a regression')
+    args = parser.parse_args()
+
+    current = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'results': []
+    }
+    for size in args.sizes:
+        current['results'] += run_size(size, args.reference_max_rows,
+                                       args.repeat)
+
+    previous_name, previous = save_results('bench', current)
+    if previous:
+        print(f'Compared with {previous_name}:')
+        regressions = compare(previous, current, args.threshold)
+        if regressions:
+            raise SystemExit('Regressions:\n' + '\n'.join(regressions))
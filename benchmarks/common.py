@@ -0,0 +1,36 @@
+import datetime
+import json
+import subprocess
+from pathlib import Path
+
+# Standard library only, bench_import must not load pandas or numpy itself
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(prefix: str, current: dict) -> tuple:
+    '''Save current as the newest results/{prefix}_*.json run
+
+    Returns:
+        tuple: Name of the previous run and its results, (None, None) on the first run
+    '''
+    RESULTS_DIR.mkdir(exist_ok=True)
+    previous_files = sorted(RESULTS_DIR.glob(f'{prefix}_*.json'))
+    result_file = RESULTS_DIR / f'{prefix}_{datetime.datetime.now():%Y%m%d_%H%M%S}.json'
+    with open(result_file, 'w') as json_file:
+        json.dump(current, json_file, indent=2)
+    print(f'Results saved to {result_file}')
+
+    if not previous_files:
+        return None, None
+    with open(previous_files[-1]) as json_file:
+        return previous_files[-1].name, json.load(json_file)
@@ -0,0 +1,89 @@
+import datetime
+import random
+
+# Position ids as used in main.DEFAULT_POSITIONS plus one that is never reported
+POSITIONS = {
+    '3115142': '24/7 Cisco Urgent',
+    '3115140': '24/7 O1 Urgent',
+    '3115141': '24/7 O2 Planned/Backup',
+    '3110230': '24/7 Cisco Urgent',
+    '3110228': '24/7 T1 Urgent',
+    '3110229': '24/7 T2 Planned/Backup',
+    '3100000': 'Office'
+}
+TITLES = ['Morning/Day', 'Night', 'Weekend', '']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _crossing_start(rng: random.Random, start_date: datetime.date,
+                    days: int) -> datetime.datetime:
+    '''Return a start on a Friday or Sunday evening so the shift crosses into the weekend or the week'''
+    crossing_days = [
+        offset for offset in range(days)
+        if (start_date + datetime.timedelta(days=offset)).weekday() in (4, 6)
+    ] or [0]
+    day = start_date + datetime.timedelta(days=rng.choice(crossing_days))
+    return datetime.datetime.combine(
+        day, datetime.time(hour=rng.randrange(18, 23)))
+
+
+def generate_shifts_payload(shifts: int,
+                            employees_per_shift: int = 1,
+                            on_call_share: float = 0.1,
+                            weekend_crossing_share: float = 0.1,
+                            start_date: datetime.date = datetime.date(
+                                2024, 1, 1),
+                            days: int = 365,
+                            employees: int = 80,
+                            seed: int = 0) -> dict:
+    '''Generate a Humanity /shifts response with the fields report_generator reads
+
+    Args:
+        shifts (int): Number of shifts
+        employees_per_shift (int): Employees rostered on each shift
+        on_call_share (float): Share of shifts with one additional on call employee
+        weekend_crossing_share (float): Share of shifts crossing a weekday/weekend midnight
+        start_date (datetime.date): First day of the span
+        days (int): Length of the span in days
+        employees (int): Size of the employee pool
+        seed (int): Random seed, equal arguments give equal payloads
+
+    Returns:
+        dict: Payload in the shape returned by api_handler.get_shifts
+    '''
+    rng = random.Random(seed)
+    names = [f'Employee {index:04d}' for index in range(employees)]
+    position_ids = list(POSITIONS)
+    data = []
+    for shift_id in range(shifts):
+        if rng.random() < weekend_crossing_share:
+            shift_start = _crossing_start(rng, start_date, days)
+        else:
+            shift_start = datetime.datetime.combine(
+                start_date, datetime.time()) + datetime.timedelta(
+                    minutes=15 * rng.randrange(days * 96))
+        shift_end = shift_start + datetime.timedelta(
+            minutes=15 * rng.randrange(16, 56))
+        paidtime = (shift_end - shift_start).total_seconds() / 3600
+        pos_id = rng.choice(position_ids)
+
+        shift = {
+            'id': 10_000_000 + shift_id,
+            'start_timestamp': shift_start.strftime(TIMESTAMP_FORMAT),
+            'end_timestamp': shift_end.strftime(TIMESTAMP_FORMAT),
+            'schedule': pos_id,
+            'schedule_name': POSITIONS[pos_id],
+            'title': rng.choice(TITLES),
+            'paidtime': paidtime,
+            'notes': rng.choice(['', '', 'Covered by phone'])
+        }
+        shift['employees'] = [{
+            'id': index,
+            'name': names[index],
+            'paidtime': paidtime - rng.choice([0, 0, 1])
+        } for index in rng.sample(range(employees), employees_per_shift)]
+        if rng.random() < on_call_share:
+            index = rng.randrange(employees)
+            shift['employeesOnCall'] = [{'id': index, 'name': names[index]}]
+        data.append(shift)
+    return {'status': 1, 'data': data}
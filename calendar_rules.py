@@ -0,0 +1,101 @@
+import copy
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Rules matching the behaviour before rules files existed
+DEFAULT_RULES = {
+    'timezone': None,
+    'business_hours': ['09:00', '18:00'],
+    'weekend_days': [5, 6],
+    'holidays': [],
+    'positions': {},
+    'breaks': [{
+        'pos_ids': ['3110228', '3115140'],
+        'titles': ['Morning/Day'],
+        'hours': 9.0
+    }]
+}
+
+
+def load_rules(filename: Path | None) -> dict:
+    '''Read a rules file, keys missing from the file fall back to DEFAULT_RULES
+
+    Args:
+        filename (Path | None): JSON rules file, None returns the defaults
+
+    Returns:
+        dict: Rules
+    '''
+    rules = copy.deepcopy(DEFAULT_RULES)
+    if filename is not None:
+        with open(filename) as json_file:
+            rules.update(json.load(json_file))
+    return rules
+
+
+def rules_version(rules: dict) -> str:
+    '''Return a short hash identifying the rules, used to invalidate stored aggregates'''
+    return hashlib.sha256(
+        json.dumps(rules, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# Keys a position rule may set
+POSITION_RULE_KEYS = {'business_hours'}
+
+
+# Function to reject position rules that would otherwise be ignored silently
+def _check_position_rules(positions: dict) -> None:
+    for pos_id, position_rules in positions.items():
+        if not isinstance(position_rules, dict):
+            raise ValueError(
+                f'Rules of position {pos_id} must be an object, e.g. '
+                '{"business_hours": ["08:00", "20:00"]}')
+        unknown = set(position_rules) - POSITION_RULE_KEYS
+        if unknown:
+            raise ValueError(f'Unknown rules for position {pos_id}: '
+                             f'{", ".join(sorted(unknown))}')
+
+
+# Function to parse HH:MM into a timedelta64 offset from midnight
+def _time_of_day(value: str) -> np.timedelta64:
+    hours, minutes = value.split(':')
+    return np.timedelta64(int(hours) * 60 + int(minutes), 'm')
+
+
+def compile_rules(rules: dict) -> dict:
+    '''Compile rules once into arrays used by the vectorized hour split
+
+    Args:
+        rules (dict): Rules from load_rules
+
+    Returns:
+        dict: timezone, business_start/business_end offsets, weekend lookup by
+        weekday, sorted holiday dates, per position business hours, breaks and
+        the rules version
+
+    Raises:
+        ValueError: A position rule is not an object or has unknown keys
+    '''
+    _check_position_rules(rules['positions'])
+    weekend = np.zeros(7, dtype=bool)
+    weekend[list(rules['weekend_days'])] = True
+    business_start, business_end = map(_time_of_day, rules['business_hours'])
+    position_hours = {}
+    for pos_id, position_rules in rules['positions'].items():
+        if 'business_hours' in position_rules:
+            position_hours[str(pos_id)] = tuple(
+                map(_time_of_day, position_rules['business_hours']))
+    return {
+        'timezone': rules['timezone'],
+        'business_start': business_start,
+        'business_end': business_end,
+        'weekend': weekend,
+        'holidays': np.unique(np.array(rules['holidays'],
+                                       dtype='datetime64[D]')),
+        'position_hours': position_hours,
+        'breaks': rules['breaks'],
+        'version': rules_version(rules)
+    }
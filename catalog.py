@@ -0,0 +1,129 @@
+import datetime
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+
+class Catalog:
+    '''Id indexed catalog cached in a JSON file with a time to live
+
+    A fresh file is served as is. A stale file is served immediately while a
+    background refresh replaces it, a missing file is fetched synchronously.
+    Asking for an unknown id triggers one synchronous refresh per instance and
+    time to live, so long running processes can keep the instance.
+    '''
+
+    def __init__(self,
+                 path: Path,
+                 fetch: Callable[[], dict | None],
+                 ttl: datetime.timedelta,
+                 key: str = 'id'):
+        '''
+        Args:
+            path (Path): JSON cache file, same layout as the fetch result
+            fetch (Callable[[], dict | None]): Returns the catalog from the API, None on failure
+            ttl (datetime.timedelta): Age after which the file is refreshed
+            key (str): Entry field used as id
+        '''
+        self.path = path
+        self.fetch = fetch
+        self.ttl = ttl
+        self.key = key
+        self._lock = threading.Lock()
+        self._data: dict = {}
+        self._index: dict = {}
+        self._order: dict = {}
+        self._loaded = False
+        self._refreshed = False
+        self._refresh_thread: threading.Thread | None = None
+        self._checked_at = 0.0
+
+    def _set(self, data: dict) -> None:
+        self._data = data
+        self._index = {}
+        self._order = {}
+        for order, entry in enumerate(data.values()):
+            self._index.setdefault(entry[self.key], entry)
+            self._order.setdefault(entry[self.key], order)
+
+    def _is_stale(self) -> bool:
+        age = time.time() - self.path.stat().st_mtime
+        return age > self.ttl.total_seconds()
+
+    def _refresh_in_background(self) -> None:
+        self._checked_at = time.time()
+        self._refresh_thread = threading.Thread(target=self.refresh,
+                                                daemon=True)
+        self._refresh_thread.start()
+
+    def refresh(self) -> bool:
+        '''Fetch the catalog and rewrite the cache file, return False if the fetch failed'''
+        self._refreshed = True
+        self._checked_at = time.time()
+        data = self.fetch()
+        if not isinstance(data, dict):
+            return False
+        # Written to a temporary file first so a process exiting mid-write
+        # (e.g. while this runs in a background thread) never truncates the cache
+        temporary = self.path.with_name(
+            f'{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            with open(temporary, 'w') as json_file:
+                json.dump(data, json_file, indent=2)
+            os.replace(temporary, self.path)
+        finally:
+            temporary.unlink(missing_ok=True)
+        # Round trip through JSON so keys match the file layout
+        data = json.loads(json.dumps(data))
+        with self._lock:
+            self._set(data)
+        return True
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            # Kept instances refresh in the background once per time to live, failed or not
+            if time.time() - self._checked_at > self.ttl.total_seconds():
+                self._refreshed = False
+                self._refresh_in_background()
+            return
+        self._loaded = True
+        try:
+            with open(self.path) as json_file:
+                data = json.load(json_file)
+        except (OSError, ValueError):
+            # A missing or unreadable cache file is fetched again
+            self.refresh()
+            return
+        with self._lock:
+            self._set(data)
+        self._checked_at = self.path.stat().st_mtime
+        if self._is_stale():
+            self._refresh_in_background()
+
+    def data(self) -> dict:
+        self._ensure_loaded()
+        return self._data
+
+    def get(self, entry_id: str) -> dict | None:
+        '''Return the entry for the id, refreshing once if it is unknown'''
+        self._ensure_loaded()
+        if entry_id not in self._index:
+            # A refresh in flight marks the instance refreshed before it has
+            # fetched, wait for it as it may bring the id
+            refresh_thread = self._refresh_thread
+            if refresh_thread is not None and refresh_thread.is_alive():
+                refresh_thread.join()
+            if entry_id not in self._index and not self._refreshed:
+                self.refresh()
+        return self._index.get(entry_id)
+
+    def ordered(self, entry_ids) -> list[dict]:
+        '''Return entries for the known ids in catalog order'''
+        entries = [
+            entry for entry in map(self.get, dict.fromkeys(entry_ids))
+            if entry is not None
+        ]
+        return sorted(entries, key=lambda entry: self._order[entry[self.key]])
@@ -0,0 +1,212 @@
+import argparse
+import collections
+import datetime
+import gc
+import json
+import logging
+import os
+import signal
+import threading
+import time
+import traceback
+from pathlib import Path
+
+import main
+from instrumentation import add_listener, peak_rss_mib, remove_listener
+
+script_path = Path(__file__).resolve()
+script_parent = script_path.parent
+
+# Constants and configurations
+STATUS_FILE = script_parent / 'output' / 'daemon_status.json'
+SCHEDULES = ('monthly', 'daily')
+# Longest sleep between checks of the clock and the stop flag
+MAX_SLEEP_SECONDS = 60
+
+
+def get_time(time_str):
+    try:
+        return datetime.datetime.strptime(time_str, '%H:%M').time()
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid time format. Use HH:MM')
+
+
+def next_run(now: datetime.datetime, schedule: str, at: datetime.time,
+             day: int) -> datetime.datetime:
+    '''Return the first scheduled time after now
+
+    Args:
+        now (datetime.datetime): Current local time
+        schedule (str): monthly runs on the given day of every month, daily runs every day
+        at (datetime.time): Time of day of the run
+        day (int): Day of the month for monthly runs
+
+    Returns:
+        datetime.datetime: Next run time
+    '''
+    candidate = datetime.datetime.combine(now.date(), at)
+    if schedule == 'daily':
+        return candidate if candidate > now else candidate + datetime.timedelta(
+            days=1)
+    candidate = candidate.replace(day=day)
+    if candidate <= now:
+        month_end = candidate.replace(day=28) + datetime.timedelta(days=4)
+        candidate = candidate.replace(year=month_end.year,
+                                      month=month_end.month)
+    return candidate
+
+
+def report_argv(schedule: str, run_date: datetime.date,
+                report_args: list) -> list:
+    '''Return the main.py arguments of a run
+
+    Monthly runs report the previous month (the main.py default), daily runs
+    report the month to date up to yesterday.
+    '''
+    if schedule == 'monthly':
+        return list(report_args)
+    end_date = run_date - datetime.timedelta(days=1)
+    return [
+        '--report_start_date',
+        end_date.replace(day=1).strftime('%m.%d.%Y'), '--report_end_date',
+        end_date.strftime('%m.%d.%Y'), *report_args
+    ]
+
+
+def write_status(status_file: Path, status: dict) -> None:
+    # Written to a temporary file first so readers never see a partial file
+    temporary = status_file.with_name(status_file.name + '.tmp')
+    with open(temporary, 'w') as json_file:
+        json.dump(status, json_file, indent=2, default=str)
+    os.replace(temporary, status_file)
+
+
+def run_once(argv: list) -> dict:
+    '''Run main.main in this process and return the run record with per stage timings'''
+    record = {
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'argv': argv,
+        'stages': []
+    }
+
+    def collect(stage_record):
+        record['stages'].append({
+            key: stage_record.get(key)
+            for key in ('stage', 'status', 'rows', 'wall_seconds',
+                        'cpu_seconds')
+        })
+
+    add_listener(collect)
+    started = time.perf_counter()
+    try:
+        main.main(argv)
+        record['status'] = 'ok'
+    except (Exception, SystemExit) as error:
+        record['status'] = 'error'
+        record['error'] = f'{type(error).__name__}: {error}'
+        logging.error(f'Scheduled run failed: {traceback.format_exc()}')
+    finally:
+        remove_listener(collect)
+        # Release the run's frames before the next run, warm caches stay bounded
+        gc.collect()
+    record['seconds'] = round(time.perf_counter() - started, 3)
+    record['peak_rss_mib'] = peak_rss_mib()
+    return record
+
+
+def serve(args, report_args: list) -> None:
+    '''Run the report on the schedule until SIGTERM or SIGINT, writing the status file'''
+    from http_client import get_stats
+    from shift_store import configure_memory_cache, memory_cache_stats
+
+    configure_memory_cache(args.max_cached_shifts)
+    stop = threading.Event()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda *_: stop.set())
+
+    runs = collections.deque(maxlen=args.keep_runs)
+    status = {
+        'pid': os.getpid(),
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'schedule': args.schedule,
+        'state': 'idle',
+        'next_run': None,
+        'runs': runs
+    }
+
+    def update(**changes):
+        status.update(changes,
+                      shift_cache=memory_cache_stats(),
+                      http=get_stats())
+        write_status(args.status_file,
+                     {**status, 'runs': list(status['runs'])})
+
+    due = datetime.datetime.now() if args.run_now else None
+    while not stop.is_set():
+        if due is None:
+            due = next_run(datetime.datetime.now(), args.schedule, args.at,
+                           args.day)
+        update(state='idle', next_run=due.isoformat(timespec='seconds'))
+        while not stop.is_set() and datetime.datetime.now() < due:
+            remaining = (due - datetime.datetime.now()).total_seconds()
+            stop.wait(min(max(remaining, 0), MAX_SLEEP_SECONDS))
+        if stop.is_set():
+            break
+
+        argv = report_argv(args.schedule, due.date(), report_args)
+        update(state='running', next_run=None)
+        logging.info(f'Scheduled run started: {" ".join(argv)}')
+        run = run_once(argv)
+        runs.append(run)
+        logging.info(
+            f'Scheduled run finished: {run["status"]} in {run["seconds"]}s')
+        due = None
+    update(state='stopped', next_run=None)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run the report on a schedule in a long running process, '
+        'arguments not listed here are passed to main.py')
+    parser.add_argument('--schedule',
+                        choices=SCHEDULES,
+                        default='monthly',
+                        help='monthly reports the previous month, daily the month to date')
+    parser.add_argument('--at',
+                        type=get_time,
+                        default=datetime.time(6, 0),
+                        help='Time of day of the run in HH:MM format')
+    parser.add_argument('--day',
+                        type=int,
+                        choices=range(1, 29),
+                        default=1,
+                        metavar='1-28',
+                        help='Day of the month of monthly runs')
+    parser.add_argument('--run_now',
+                        action='store_true',
+                        default=False,
+                        help='Run once at startup before following the schedule')
+    parser.add_argument('--max_cached_shifts',
+                        type=int,
+                        default=500_000,
+                        help='Shifts kept in memory between runs for timesheets, shift reports and batch jobs, least recently used ranges are evicted')
+    parser.add_argument('--keep_runs',
+                        type=int,
+                        default=50,
+                        help='Runs listed in the status file')
+    parser.add_argument('--status_file',
+                        type=Path,
+                        default=STATUS_FILE,
+                        help='JSON file with the daemon state and per run timings')
+    args, report_args = parser.parse_known_args()
+
+    # Fail on bad report arguments now instead of at the first scheduled run
+    main.parse_args(
+        report_argv(args.schedule, datetime.date.today(), report_args))
+
+    logging.basicConfig(filename=main.LOG_FILE,
+                        level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        encoding='utf-8')
+    logging.info(f'Daemon started with {args.schedule} schedule')
+    serve(args, report_args)
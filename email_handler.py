@@ -0,0 +1,195 @@
+import json
+import smtplib
+import threading
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+
+# Connections are reopened after this many messages, servers often limit messages per session
+MESSAGES_PER_CONNECTION = 100
+
+
+def read_json(filename):
+    with open(filename, 'r') as file:
+        data = json.load(file)
+    return data
+
+
+def get_email_credentials(filename):
+    credentials = read_json(filename)
+    smtp_server = credentials['smtp_server']
+    smtp_port = credentials['smtp_port']
+    email_address = credentials['email_address']
+    email_password = credentials['email_password']
+    return smtp_server, smtp_port, email_address, email_password
+
+
+def get_recipient_emails(filename):
+    recipient_data = read_json(filename)
+    to_emails = recipient_data['recipients']
+    return to_emails
+
+
+def create_email(subject,
+                 message,
+                 from_email,
+                 to_emails,
+                 attachment_path=None,
+                 attachment_name=None):
+    msg = MIMEMultipart()
+    msg['From'] = from_email
+    msg['To'] = ', '.join(to_emails)
+    msg['Subject'] = subject
+
+    msg.attach(MIMEText(message, 'plain'))
+
+    if attachment_path:
+        with open(attachment_path, 'rb') as attachment:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(attachment.read())
+
+        encoders.encode_base64(part)
+        part.add_header(
+            "Content-Disposition",
+            f"attachment; filename={attachment_name or Path(attachment_path).name}",
+        )
+        msg.attach(part)
+
+    return msg
+
+
+# Function to open an authenticated connection, STARTTLS and login are skipped when disabled
+def connect(smtp_server,
+            smtp_port,
+            email_address,
+            email_password,
+            use_tls=True,
+            timeout=60):
+    server = smtplib.SMTP(smtp_server, smtp_port, timeout=timeout)
+    try:
+        if use_tls:
+            server.starttls()
+        if email_password:
+            server.login(email_address, email_password)
+    except smtplib.SMTPException:
+        server.close()
+        raise
+    return server
+
+
+def send_email(smtp_server, smtp_port, email_address, email_password, msg):
+    with connect(smtp_server, smtp_port, email_address,
+                 email_password) as server:
+        text = msg.as_string()
+        server.sendmail(msg['From'], msg['To'].split(', '), text)
+
+
+def _result(email, error):
+    return {'to_emails': email['to_emails'], 'sent': error is None, 'error': error}
+
+
+def send_bulk(emails,
+              smtp_server,
+              smtp_port,
+              email_address,
+              email_password,
+              pool_size=2,
+              use_tls=True,
+              messages_per_connection=MESSAGES_PER_CONNECTION):
+    '''Send many emails over a small pool of reused authenticated SMTP connections
+
+    Args:
+        emails (Iterable[dict]): create_email arguments (subject, message,
+            from_email, to_emails, optional attachment_path and attachment_name)
+            for each email, consumed lazily
+        smtp_server (str): SMTP host
+        smtp_port (int): SMTP port
+        email_address (str): Login user
+        email_password (str): Login password, empty skips the login
+        pool_size (int): Number of connections sending in parallel
+        use_tls (bool): Upgrade connections with STARTTLS
+        messages_per_connection (int): Messages sent before a connection is reopened
+
+    Returns:
+        list[dict]: to_emails, sent and error for each email in input order
+    '''
+    emails = enumerate(emails)
+    lock = threading.Lock()
+    results = {}
+
+    def next_email():
+        with lock:
+            return next(emails, None)
+
+    def worker():
+        server = None
+        sent_on_connection = 0
+        while (item := next_email()) is not None:
+            index, email = item
+            try:
+                # The message is built only when it is sent, one per worker is held in memory
+                msg = create_email(email['subject'], email['message'],
+                                   email['from_email'], email['to_emails'],
+                                   email.get('attachment_path'),
+                                   email.get('attachment_name'))
+            except OSError as e:
+                results[index] = _result(email, f'{type(e).__name__}: {e}')
+                continue
+
+            # A dropped connection is reopened once for the same message
+            for _ in range(2):
+                try:
+                    if (server is None or
+                            sent_on_connection >= messages_per_connection):
+                        if server is not None:
+                            server.quit()
+                        server = connect(smtp_server, smtp_port, email_address,
+                                         email_password, use_tls)
+                        sent_on_connection = 0
+                    sent_on_connection += 1
+                    refused = server.sendmail(msg['From'], email['to_emails'],
+                                              msg.as_string())
+                    error = f'Refused recipients: {", ".join(refused)}' if refused else None
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    server = None
+                    error = f'Server disconnected: {e}'
+                except smtplib.SMTPException as e:
+                    # The server rejected this message, the connection stays usable
+                    error = f'{type(e).__name__}: {e}'
+                    break
+                except OSError as e:
+                    server = None
+                    error = f'{type(e).__name__}: {e}'
+            results[index] = _result(email, error)
+        if server is not None:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                pass
+
+    workers = [threading.Thread(target=worker) for _ in range(pool_size)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return [results[index] for index in sorted(results)]
+
+
+if __name__ == '__main__':
+    # Usage example
+    smtp_server, smtp_port, email_address, email_password = get_email_credentials(
+        './auth/credentials_smtp.json')
+    to_emails = get_recipient_emails('recipients.json')
+
+    subject = 'CSV file'
+    message = 'Please find the attached CSV file.'
+    from_email = email_address
+    attachment_path = './output/report_2024-02-01_2024-02-28.csv'
+
+    email_msg = create_email(subject, message, from_email, to_emails,
+                             attachment_path)
+    send_email(smtp_server, smtp_port, email_address, email_password,
+               email_msg)
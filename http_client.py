@@ -0,0 +1,306 @@
+import datetime
+import email.utils
+import gzip
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# Status codes worth retrying, POST requests are only retried on 429 so an email is never sent twice
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+POST_RETRY_STATUS_CODES = {429}
+
+settings = {
+    'timeout': (10, 120),  # connect, read seconds
+    'max_retries': 3,
+    'backoff_factor': 0.5,
+    'backoff_max': 30.0,
+    'pool_maxsize': 16,
+}
+
+# Query parameters and response fields never written to fixtures
+SECRET_PARAMS = {'access_token'}
+SECRET_FIELDS = {'access_token', 'refresh_token', 'id_token'}
+
+_session: requests.Session | None = None
+_lock = threading.Lock()
+_stats: dict = {}
+_fixture_mode = 'live'
+_fixture_dir: Path | None = None
+
+
+def configure(**kwargs) -> None:
+    '''Update client settings, the session is rebuilt on next use
+
+    Args:
+        **kwargs: Any of timeout, max_retries, backoff_factor, backoff_max, pool_maxsize
+    '''
+    global _session
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f'Unknown HTTP client settings: {", ".join(unknown)}')
+    with _lock:
+        settings.update(kwargs)
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session() -> requests.Session:
+    '''Return the shared keep-alive session used by all handlers'''
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4,
+                                  pool_maxsize=settings['pool_maxsize'])
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def _record(host: str, **counts) -> None:
+    with _lock:
+        host_stats = _stats.setdefault(host, {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'total_seconds': 0.0,
+            'max_seconds': 0.0
+        })
+        for key, value in counts.items():
+            if key == 'max_seconds':
+                host_stats[key] = max(host_stats[key], value)
+            else:
+                host_stats[key] += value
+
+
+def get_stats() -> dict:
+    '''Return a copy of the per-host request, retry and latency counters'''
+    with _lock:
+        return {host: dict(values) for host, values in _stats.items()}
+
+
+def reset_stats() -> None:
+    with _lock:
+        _stats.clear()
+
+
+# Function to read Retry-After as seconds, it can be a delay or an HTTP date, None if missing or malformed
+def _retry_after(response: requests.Response) -> float | None:
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    # HTTP dates are GMT, a date without a zone is not local time
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+# Function to get exponential backoff with full jitter for the given attempt
+def _backoff(attempt: int) -> float:
+    return random.uniform(
+        0, min(settings['backoff_max'],
+               settings['backoff_factor'] * 2**attempt))
+
+
+def configure_fixtures(mode: str, fixture_dir: Path | None = None) -> None:
+    '''Switch between live traffic, recording responses to fixtures and replaying them
+
+    Args:
+        mode (str): live, record or replay
+        fixture_dir (Path | None): Directory of the compressed fixture files
+    '''
+    global _fixture_mode, _fixture_dir
+    if mode not in ('live', 'record', 'replay'):
+        raise ValueError(f'Unknown fixture mode: {mode}')
+    if mode != 'live' and fixture_dir is None:
+        raise ValueError(f'{mode} mode needs a fixture directory')
+    if mode == 'record':
+        fixture_dir.mkdir(parents=True, exist_ok=True)
+    _fixture_mode = mode
+    _fixture_dir = fixture_dir
+
+
+# Function to name the fixture of a request, secrets are left out of the key
+def _fixture_path(method: str, url: str, params: dict | None,
+                  headers: dict | None = None) -> Path:
+    params = {
+        key: str(value)
+        for key, value in (params or {}).items() if key not in SECRET_PARAMS
+    }
+    key = [method.upper(), url, params]
+    # Chunks of an upload session share the URL and differ by range
+    content_range = (headers or {}).get('Content-Range')
+    if content_range:
+        key.append(content_range)
+    key = json.dumps(key, sort_keys=True)
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    parsed = urlparse(url)
+    name = re.sub(r'[^A-Za-z0-9]+', '_', parsed.netloc + parsed.path).strip('_')
+    return _fixture_dir / f'{method.lower()}_{name}_{digest}.json.gz'
+
+
+def _redact(text: str) -> str:
+    try:
+        body = json.loads(text)
+    except ValueError:
+        return text
+    if not isinstance(body, dict) or not SECRET_FIELDS & set(body):
+        return text
+    return json.dumps({
+        key: 'redacted' if key in SECRET_FIELDS else value
+        for key, value in body.items()
+    })
+
+
+def _save_fixture(path: Path, method: str, url: str, params: dict | None,
+                  payload, response: requests.Response) -> None:
+    fixture = {
+        'request': {
+            'method': method.upper(),
+            'url': url,
+            'params': {
+                key: value
+                for key, value in (params or {}).items()
+                if key not in SECRET_PARAMS
+            },
+            # Form data carries credentials and is never recorded, JSON payloads are (e.g. sendMail)
+            'json': payload
+        },
+        'response': {
+            'status_code': response.status_code,
+            'content_type': response.headers.get('Content-Type'),
+            'text': _redact(response.text)
+        }
+    }
+    with gzip.open(path, 'wt', encoding='utf-8') as fixture_file:
+        json.dump(fixture, fixture_file)
+
+
+def _load_fixture(path: Path, url: str) -> requests.Response:
+    if not path.exists():
+        raise FileNotFoundError(
+            f'No recorded response for {url} in {_fixture_dir}')
+    with gzip.open(path, 'rt', encoding='utf-8') as fixture_file:
+        recorded = json.load(fixture_file)['response']
+    response = requests.Response()
+    response.status_code = recorded['status_code']
+    response._content = recorded['text'].encode('utf-8')
+    # Streaming callers iterate and close the response like a live one
+    response._content_consumed = True
+    response.raw = io.BytesIO(response._content)
+    response.encoding = 'utf-8'
+    response.url = url
+    if recorded['content_type']:
+        response.headers['Content-Type'] = recorded['content_type']
+    return response
+
+
+def request(method: str,
+            url: str,
+            max_retries: int | None = None,
+            **kwargs) -> requests.Response:
+    '''Send a request over the shared session with timeout, retry and backoff
+
+    In record mode the response is also saved as a fixture, in replay mode it is
+    served from the fixture without touching the network.
+
+    Args:
+        method (str): HTTP method
+        url (str): Request URL
+        max_retries (int | None): Override for the configured retry count
+        **kwargs: Passed to requests.Session.request
+
+    Returns:
+        requests.Response: Last response received, callers check the status code
+    '''
+    if _fixture_mode == 'replay':
+        return _load_fixture(
+            _fixture_path(method, url, kwargs.get('params'),
+                          kwargs.get('headers')), url)
+    if _fixture_mode == 'record':
+        response = _send(method, url, max_retries, **kwargs)
+        _save_fixture(
+            _fixture_path(method, url, kwargs.get('params'),
+                          kwargs.get('headers')), method, url,
+            kwargs.get('params'), kwargs.get('json'), response)
+        return response
+    return _send(method, url, max_retries, **kwargs)
+
+
+# Function to tell whether a failed request never reached the server, e.g. connection refused
+def _not_sent(error: requests.RequestException) -> bool:
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    # requests wraps urllib3's MaxRetryError, the cause is its reason
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
+
+
+def _send(method: str, url: str, max_retries: int | None,
+          **kwargs) -> requests.Response:
+    if max_retries is None:
+        max_retries = settings['max_retries']
+    kwargs.setdefault('timeout', settings['timeout'])
+    is_post = method.upper() == 'POST'
+    retry_codes = POST_RETRY_STATUS_CODES if is_post else RETRY_STATUS_CODES
+    host = urlparse(url).netloc
+    session = get_session()
+
+    for attempt in range(max_retries + 1):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            elapsed = time.perf_counter() - started
+            _record(host, requests=1, total_seconds=elapsed,
+                    max_seconds=elapsed)
+            # A read timeout or dropped connection may come after the server
+            # accepted the POST, sending it again could e.g. send an email twice
+            if attempt == max_retries or is_post and not _not_sent(error):
+                _record(host, failures=1)
+                raise
+            _record(host, retries=1)
+            time.sleep(_backoff(attempt))
+            continue
+
+        elapsed = time.perf_counter() - started
+        _record(host, requests=1, total_seconds=elapsed, max_seconds=elapsed)
+        if response.status_code not in retry_codes:
+            return response
+        if attempt == max_retries:
+            _record(host, failures=1)
+            return response
+        _record(host, retries=1)
+        delay = _retry_after(response)
+        # The discarded response gives its connection back to the pool
+        response.close()
+        time.sleep(_backoff(attempt) if delay is None else delay)
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request('POST', url, **kwargs)
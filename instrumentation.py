@@ -0,0 +1,96 @@
+import contextlib
+import cProfile
+import datetime
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+_lock = threading.Lock()
+_metrics_file: Path | None = None
+_run_id: str | None = None
+_listeners: list = []
+
+
+def configure(metrics_file: Path | None, run_id: str | None = None) -> None:
+    '''Write stage records as JSON lines to metrics_file, None disables writing
+
+    Args:
+        metrics_file (Path | None): JSON lines file, usually next to the event log
+        run_id (str | None): Identifier shared by all records of a run, defaults to the start time
+    '''
+    global _metrics_file, _run_id
+    _metrics_file = metrics_file
+    _run_id = run_id or datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def peak_rss_mib() -> float | None:
+    '''Return peak resident set size of the process in MiB'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def add_listener(callback) -> None:
+    '''Call callback with every finished stage record, e.g. to collect per run timings'''
+    with _lock:
+        _listeners.append(callback)
+
+
+def remove_listener(callback) -> None:
+    with _lock:
+        _listeners.remove(callback)
+
+
+def _write(record: dict) -> None:
+    for callback in list(_listeners):
+        callback(record)
+    if _metrics_file is None:
+        return
+    with _lock, open(_metrics_file, 'a', encoding='utf-8') as metrics:
+        metrics.write(json.dumps(record) + '\n')
+
+
+@contextlib.contextmanager
+def stage(name: str, rows: int | None = None):
+    '''Record wall time, CPU time, peak RSS and row count of the enclosed block
+
+    Yields the record dict, set record['rows'] inside the block once the count is known.
+    '''
+    record = {'run_id': _run_id, 'stage': name, 'rows': rows}
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        yield record
+        record['status'] = 'ok'
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        record['wall_seconds'] = round(time.perf_counter() - wall_started, 6)
+        record['cpu_seconds'] = round(time.process_time() - cpu_started, 6)
+        record['peak_rss_mib'] = peak_rss_mib()
+        _write(record)
+
+
+@contextlib.contextmanager
+def profile(output_file: Path | None | bool):
+    '''Run the enclosed block under cProfile and dump stats to output_file, a falsy value disables profiling'''
+    if not output_file:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_file)
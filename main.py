@@ -1,21 +1,30 @@
 import argparse
 import datetime
+import importlib.util
 import json
 import logging
 from pathlib import Path
 
-from api_handler import get_access_token, get_positions, get_shifts
-from office_handler import get_email_details, send_email
-from report_generator import generate_shift_report, generate_standby_report
+# Only light modules are imported here, pandas, numpy and the HTTP stack are
+# imported by the stages that use them so --help and bad arguments return fast
+from catalog import Catalog
+from instrumentation import configure as configure_instrumentation
+from instrumentation import profile, stage
+from report_writer import FORMATS, check_format, report_path, write_report
 
 script_path = Path(__file__).resolve()
 script_parent = script_path.parent
 
 # Constants and configurations
 CREDENTIALS_FILE = script_parent / 'auth' / 'credentials_humanity.json'
+TOKEN_CACHE_FILE = script_parent / 'auth' / 'token_cache.json'
+SMTP_CREDENTIALS_FILE = script_parent / 'auth' / 'credentials_smtp.json'
 POSITIONS_FILE = script_parent / 'files' / 'positions.json'
+EMPLOYEES_FILE = script_parent / 'files' / 'employees.json'
 EMAIL_FILE = script_parent / 'files' / 'email_details.json'
+SHIFT_STORE_FILE = script_parent / 'files' / 'shifts.sqlite3'
 LOG_FILE = script_parent / 'output' / 'event.log'
+METRICS_FILE = script_parent / 'output' / 'stages.jsonl'
 
 OUTPUT_REPORT_PATH = script_parent / 'output' / 'report_'
 DEFAULT_POSITIONS = {
@@ -27,11 +36,19 @@ DEFAULT_POSITIONS = {
     '3110229': '24/7 T2 Planned/Backup'
 }
 
-# Logging configuration
-logging.basicConfig(filename=LOG_FILE,
-                    level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    encoding='utf-8')
+# Catalogs kept between runs when main() is called repeatedly (daemon.py)
+_catalogs: dict = {}
+
+
+def get_catalog(path, fetch, ttl):
+    '''Return the catalog of the file, reusing the instance of an earlier run'''
+    catalog = _catalogs.get(path)
+    if catalog is None:
+        catalog = _catalogs[path] = Catalog(path, fetch, ttl)
+    # The fetch closure holds the access token of the current run
+    catalog.fetch = fetch
+    catalog.ttl = ttl
+    return catalog
 
 
 def get_date(date_str):
@@ -52,23 +69,109 @@ def last_month_last_day():
     return today.replace(day=1) - datetime.timedelta(days=1)
 
 
-def get_position_names(json_data, select_positions):
-    position_names = []
-    for entry in json_data.values():
-        if entry['id'] in select_positions:
-            position_names.append(entry['name'])
-    return position_names
+def get_position_names(positions, select_positions):
+    return [entry['name'] for entry in positions.ordered(select_positions)]
 
 
-if __name__ == '__main__':
-    logging.info('Script started.')
-    # Get position data and save to csv if needed
-    access_token = get_access_token(CREDENTIALS_FILE)
-    positions = get_positions(access_token)
-    if isinstance(positions, dict):
-        with open(POSITIONS_FILE, 'w') as json_file:
-            json.dump(positions, json_file, indent=2)
+def get_timeline(start_date, end_date):
+    return f'{start_date.strftime("%Y-%m-%d")}_{end_date.strftime("%Y-%m-%d")}'
+
+
+def load_batch_jobs(filename):
+    '''Read batch jobs, a JSON list of objects with report_start_date,
+    report_end_date (mm.dd.yyyy) and optional select_positions'''
+    with open(filename) as json_file:
+        jobs = json.load(json_file)
+    return [(get_date(job['report_start_date']),
+             get_date(job['report_end_date']),
+             list(job.get('select_positions', DEFAULT_POSITIONS.keys())))
+            for job in jobs]
+
 
+def fetch_shifts(args, access_token, start_date, end_date, select_positions):
+    from api_handler import get_shifts
+    from shift_store import get_shifts_cached
+
+    # Fetch shift data of the selected positions only, reusing fresh days from the local store
+    schedule_filter = dict.fromkeys(select_positions)
+    with stage('get_shifts') as record:
+        if args.no_store:
+            shifts_data = get_shifts(start_date,
+                                     end_date,
+                                     access_token,
+                                     schedule_filter,
+                                     window_days=args.window_days)
+        else:
+            shifts_data = get_shifts_cached(
+                start_date,
+                end_date,
+                access_token,
+                SHIFT_STORE_FILE,
+                max_age=datetime.timedelta(hours=args.max_age_hours),
+                positions=schedule_filter,
+                window_days=args.window_days)
+        record['rows'] = len(shifts_data['data']) if shifts_data else 0
+    return shifts_data
+
+
+def load_shift_report(args, access_token, start_date, end_date,
+                      select_positions, calendar):
+    from report_generator import as_pandas, generate_shift_report
+
+    # Per shift rows, for modes where the standby report was built from partials or a stream
+    shifts_data = fetch_shifts(args, access_token, start_date, end_date,
+                               select_positions)
+    if not shifts_data:
+        raise Exception('Shift data is empty')
+    return as_pandas(
+        generate_shift_report(shifts_data,
+                              select_positions,
+                              calendar,
+                              engine=args.engine))
+
+
+def run_batch(args, access_token, positions, calendar):
+    '''Fetch and process the span of all batch jobs once, then write every job report'''
+    from report_generator import (as_pandas, generate_shift_report,
+                                  generate_standby_reports)
+
+    jobs = load_batch_jobs(args.batch_file)
+    span_start = min(start_date for start_date, _, _ in jobs)
+    span_end = max(end_date for _, end_date, _ in jobs)
+    all_positions = list(
+        dict.fromkeys(position for _, _, select_positions in jobs
+                      for position in select_positions))
+
+    shifts_data = fetch_shifts(args, access_token, span_start, span_end,
+                               all_positions)
+    if not shifts_data:
+        raise Exception('Shift data is empty')
+    with profile(args.profile and script_parent / 'output' / 'batch.prof'):
+        shift_report = as_pandas(
+            generate_shift_report(shifts_data,
+                                  all_positions,
+                                  calendar,
+                                  engine=args.engine))
+        with stage('aggregation', rows=len(shift_report)):
+            standby_reports = generate_standby_reports(shift_report, jobs)
+
+    for (start_date, end_date, select_positions), standby_report in zip(
+            jobs, standby_reports):
+        timeline = get_timeline(start_date, end_date)
+        position_names = get_position_names(positions, select_positions)
+        group = '-'.join(sorted(select_positions))
+        job_report_path = report_path(
+            script_parent / 'output' / f'report_{timeline}_{group}',
+            args.output_format)
+        comment = f'This report includes positions: {"; ".join(position_names)} for the time period of {timeline.replace("_", " to ")}'
+        with stage('csv_write', rows=len(standby_report)):
+            write_report(job_report_path, comment, standby_report,
+                         args.output_format)
+        logging.info(f'Batch report written to {job_report_path}')
+
+
+def parse_args(argv=None):
+    '''Parse and validate command line arguments, nothing heavy is imported yet'''
     # Manage script command line arguments
     parser = argparse.ArgumentParser(description='Process report start date')
     parser.add_argument('--report_start_date',
@@ -85,40 +188,251 @@ if __name__ == '__main__':
                         nargs='*',
                         default=DEFAULT_POSITIONS.keys(),
                         help='List of positions (e.g. 3115142, 3115141)')
+    parser.add_argument('--window_days',
+                        type=int,
+                        default=None,
+                        help='Fetch shifts in concurrent windows of this many days')
+    parser.add_argument('--max_age_hours',
+                        type=float,
+                        default=24.0,
+                        help='Refetch days stored locally longer ago than this')
+    parser.add_argument('--no_store',
+                        action='store_true',
+                        default=False,
+                        help='Fetch the whole period from the API, bypassing the local shift store')
+    parser.add_argument('--positions_ttl_hours',
+                        type=float,
+                        default=24.0 * 7,
+                        help='Refresh the cached positions.json after this many hours')
+    parser.add_argument('--batch_file',
+                        type=Path,
+                        default=None,
+                        help='JSON list of jobs to report from a single fetch, no email is sent')
+    parser.add_argument('--stream',
+                        action='store_true',
+                        default=False,
+                        help='Stream shifts in windows (--window_days, default 7) with bounded memory')
+    parser.add_argument('--timesheets',
+                        action='store_true',
+                        default=False,
+                        help='Also write one timesheet csv per employee to output/timesheets')
+    parser.add_argument('--calendar_rules',
+                        type=Path,
+                        default=None,
+                        help='JSON file with business hours, holidays, timezone and break rules')
+    parser.add_argument('--output_format',
+                        choices=list(FORMATS),
+                        default='csv',
+                        help='File format of the standby report, parquet and arrow need pyarrow')
+    parser.add_argument('--shift_report_format',
+                        choices=list(FORMATS),
+                        default=None,
+                        help='Also save the full per shift report in this format')
+    parser.add_argument('--email_compressed',
+                        action='store_true',
+                        default=False,
+                        help='Zip the report before attaching it to the email')
+    parser.add_argument('--email_timesheets',
+                        action='store_true',
+                        default=False,
+                        help='Email every employee their timesheet over SMTP (auth/credentials_smtp.json)')
+    parser.add_argument('--engine',
+                        choices=['pandas', 'polars'],
+                        default='pandas',
+                        help='Dataframe library building the full shift report, polars is optional and uses all cores')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        default=False,
+                        help='Write cProfile stats of the report stage to the output folder')
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument('--record',
+                          type=Path,
+                          default=None,
+                          help='Save Humanity and Graph responses and email payloads to this fixture folder')
+    fixtures.add_argument('--replay',
+                          type=Path,
+                          default=None,
+                          help='Serve Humanity and Graph responses from this fixture folder, no network access')
     parser.add_argument('--email_report',
                         action='store_true',
                         default=True,
                         help='Send the report over email True or False')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    # Validate everything that can fail before any import or network call
+    if args.report_end_date < args.report_start_date:
+        parser.error('--report_end_date is before --report_start_date')
+    if args.email_timesheets and not args.timesheets:
+        parser.error('--email_timesheets needs --timesheets')
+    for filename in (args.batch_file, args.calendar_rules):
+        if filename and not filename.is_file():
+            parser.error(f'File not found: {filename}')
+    if args.engine == 'polars' and importlib.util.find_spec('polars') is None:
+        parser.error('The polars engine needs polars (pip install polars)')
+    # The shift store partials and --stream build the standby report with pandas,
+    # polars is only used where the whole shift report is built
+    builds_shift_report = (args.batch_file or args.shift_report_format
+                           or args.timesheets or not args.stream and
+                           (args.no_store or args.record or args.replay))
+    if args.engine == 'polars' and not builds_shift_report:
+        parser.error('--engine polars needs --no_store, --batch_file, '
+                     '--shift_report_format or --timesheets, the shift store '
+                     'and --stream always use pandas')
+    for output_format in {args.output_format, args.shift_report_format} - {None}:
+        try:
+            check_format(output_format)
+        except RuntimeError as error:
+            parser.error(str(error))
+    return args
+
+
+def main(argv=None):
+    '''Run the report for the given command line, sys.argv by default'''
+    args = parse_args(argv)
+
+    # Logging configuration
+    logging.basicConfig(filename=LOG_FILE,
+                        level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        encoding='utf-8')
+    logging.info('Script started.')
+
+    from api_handler import (get_access_token, get_employees, get_positions,
+                             iter_shifts)
+    from http_client import configure_fixtures, get_stats
+    from report_generator import (as_pandas, generate_shift_report,
+                                  generate_standby_report,
+                                  generate_standby_report_streaming)
+    from shift_store import get_standby_report_cached
+    from token_cache import configure as configure_token_cache
 
     report_start_date = args.report_start_date
     report_end_date = args.report_end_date
     select_positions = args.select_positions
     email_report = args.email_report
+    configure_instrumentation(METRICS_FILE)
 
-    # Fetch shift data from the API
-    shifts_data = get_shifts(report_start_date, report_end_date, access_token)
-    if not shifts_data:
-        raise Exception('Shift data is empty')
+    # Without a rules file hours are split at 9:00 to 18:00 as before
+    calendar = None
+    if args.calendar_rules:
+        from calendar_rules import compile_rules, load_rules
+        try:
+            calendar = compile_rules(load_rules(args.calendar_rules))
+        except ValueError as error:
+            raise SystemExit(
+                f'Invalid calendar rules {args.calendar_rules}: {error}')
+
+    # Recorded runs fetch everything from the API so replays issue the same requests
+    fixture_dir = args.record or args.replay
+    positions_file = POSITIONS_FILE
+    if fixture_dir:
+        configure_fixtures('record' if args.record else 'replay', fixture_dir)
+        args.no_store = True
+        positions_file = fixture_dir / 'positions.json'
+    else:
+        configure_token_cache(TOKEN_CACHE_FILE)
 
-    # Generate the report
-    shift_report = generate_shift_report(shifts_data)
-    standby_report = generate_standby_report(shift_report, select_positions)
+    # Authenticate and load the positions catalog, refreshed only when stale or missing an id
+    with stage('token_fetch'):
+        access_token = get_access_token(CREDENTIALS_FILE)
+    positions = get_catalog(
+        positions_file, lambda: get_positions(access_token),
+        datetime.timedelta(hours=args.positions_ttl_hours))
+    with stage('positions_fetch') as record:
+        record['rows'] = len(positions.data())
 
-    # Export the report to csv
-    timeline = f'{report_start_date.strftime("%Y-%m-%d")}_{report_end_date.strftime("%Y-%m-%d")}'
-    report_name = f'report_{timeline}.csv'
-    report_path = script_parent / 'output' / report_name
+    if args.batch_file:
+        run_batch(args, access_token, positions, calendar)
+        logging.info(f'HTTP client stats: {json.dumps(get_stats())}')
+        return
+
+    timeline = get_timeline(report_start_date, report_end_date)
+    shift_report = None
+    if args.stream:
+        # Stream shifts window by window into running totals, the shift store is not used
+        with stage('stream_report') as record:
+            standby_report = generate_standby_report_streaming(
+                iter_shifts(report_start_date,
+                            report_end_date,
+                            access_token,
+                            dict.fromkeys(select_positions),
+                            window_days=args.window_days or 7),
+                select_positions,
+                calendar=calendar)
+            record['rows'] = len(standby_report)
+    elif not args.no_store:
+        # Sum the daily partials kept in the shift store, only changed days are reprocessed.
+        # The fetch, the recompute of changed days and the sum are recorded as their own stages
+        with profile(args.profile and script_parent / 'output' /
+                     f'report_{timeline}.prof'):
+            standby_report = get_standby_report_cached(
+                report_start_date,
+                report_end_date,
+                access_token,
+                SHIFT_STORE_FILE,
+                select_positions,
+                max_age=datetime.timedelta(hours=args.max_age_hours),
+                calendar=calendar,
+                window_days=args.window_days)
+        if standby_report is None:
+            raise Exception('Shift data is empty')
+    else:
+        # Fetch shift data from the API
+        shifts_data = fetch_shifts(args, access_token, report_start_date,
+                                   report_end_date, select_positions)
+        if not shifts_data:
+            raise Exception('Shift data is empty')
+
+        # Generate the report
+        with profile(args.profile and script_parent / 'output' /
+                     f'report_{timeline}.prof'):
+            shift_report = generate_shift_report(shifts_data,
+                                                 select_positions,
+                                                 calendar,
+                                                 engine=args.engine)
+            with stage('aggregation', rows=len(shift_report)):
+                standby_report = generate_standby_report(
+                    shift_report, select_positions)
+
+    # Export the report in the selected format
+    standby_report_path = report_path(
+        script_parent / 'output' / f'report_{timeline}', args.output_format)
     position_names = get_position_names(positions, select_positions)
     comment = f'This report includes positions: {"; ".join(position_names)} for the time period of {timeline.replace("_", " to ")}'
     print(comment, '\n', standby_report)
 
-    with open(report_path, 'w') as f:
-        f.write('# ' + comment + '\n')
-        standby_report.to_csv(f, index=False)
+    # The stage keeps its csv_write name for every output format so recorded metrics stay comparable
+    with stage('csv_write', rows=len(standby_report)):
+        write_report(standby_report_path, comment, standby_report,
+                     args.output_format)
+
+    # The per shift report and timesheets are written from pandas
+    if shift_report is not None and (args.shift_report_format
+                                     or args.timesheets):
+        shift_report = as_pandas(shift_report)
+
+    # Full per shift report for downstream use
+    shift_report_path = None
+    if args.shift_report_format:
+        if shift_report is None:
+            shift_report = load_shift_report(args, access_token,
+                                             report_start_date,
+                                             report_end_date, select_positions,
+                                             calendar)
+        shift_report_path = report_path(
+            script_parent / 'output' / f'shifts_{timeline}',
+            args.shift_report_format)
+        with stage('csv_write', rows=len(shift_report)):
+            write_report(
+                shift_report_path,
+                f'Shifts of positions: {"; ".join(position_names)} for the time period of {timeline.replace("_", " to ")}',
+                shift_report, args.shift_report_format)
+        logging.info(f'Shift report written to {shift_report_path}')
 
     # Send the report over email
     if email_report:
+        from office_handler import (get_email_details, get_recipient_groups,
+                                    send_emails)
         print('Sending email..')
 
         # Set email details
@@ -126,24 +440,66 @@ if __name__ == '__main__':
             EMAIL_FILE)
         subject = f'Shift report - {report_start_date.strftime("%b %Y")}'
         body = f'Included positions: {"; ".join(position_names)}\n' + f'Time period: {timeline.replace("_", " to ")}\n\n' + body_default
-        send_email(sender_email,
-                   recipient_emails,
-                   subject,
-                   body,
-                   attachment_path=report_path)
-
-    # Timesheet report
-    # TODO
-    # Add shift notes to the shift report (or replace shift report with different data that includes notes)
-    # Similar to positions fetch employee list with ids and emails
-    # Create new timesheet report df
-    # For each employee in a shift report
-    #     - Include Date, Position, Start time, End time, Overtime, Shift Title, Notes
-    #     - Group and sort by date
-    #     - Save the output to csv
-    #     - Save the output to csv
-    # For each employee in a shift report
-    #     - Include Date, Position, Start time, End time, Overtime, Shift Title, Notes
-    #     - Group and sort by date
-    #     - Save the output to csv
-    #     - Save the output to csv
+        attachments = [standby_report_path]
+        if shift_report_path:
+            attachments.append(shift_report_path)
+
+        # One email per recipient group with every report attached, sent concurrently
+        emails = [{
+            'sender_email': sender_email,
+            'recipient_emails': recipients,
+            'subject': subject,
+            'body': body,
+            'attachment_path': attachments,
+            'compress': args.email_compressed
+        } for recipients in get_recipient_groups(EMAIL_FILE)]
+        with stage('send_email', rows=len(emails)):
+            results = send_emails(emails)
+        logging.info(f'{sum(map(bool, results))} of {len(emails)} emails sent')
+
+    # Timesheet report per employee, built from the same shift fetch as the standby report
+    if args.timesheets:
+        from timesheet import export_timesheets
+        if shift_report is None:
+            shift_report = load_shift_report(args, access_token,
+                                             report_start_date,
+                                             report_end_date, select_positions,
+                                             calendar)
+        employees = get_catalog(
+            EMPLOYEES_FILE, lambda: get_employees(access_token),
+            datetime.timedelta(hours=args.positions_ttl_hours))
+        with stage('timesheets', rows=len(shift_report)):
+            timesheets = export_timesheets(
+                shift_report, employees,
+                script_parent / 'output' / 'timesheets', timeline)
+        logging.info(f'{len(timesheets)} timesheets written')
+
+        # Email every employee with a known address their own timesheet over one SMTP pool
+        if args.email_timesheets:
+            from email_handler import get_email_credentials, send_bulk
+            smtp_server, smtp_port, email_address, email_password = get_email_credentials(
+                SMTP_CREDENTIALS_FILE)
+            emails = ({
+                'subject': f'Timesheet - {timeline.replace("_", " to ")}',
+                'message': 'Please find your timesheet attached.',
+                'from_email': email_address,
+                'to_emails': [employee_email],
+                'attachment_path': timesheet_path
+            } for timesheet_path, employee_email in timesheets
+                      if employee_email)
+            with stage('email_timesheets') as record:
+                results = send_bulk(emails, smtp_server, smtp_port,
+                                    email_address, email_password)
+                record['rows'] = len(results)
+            for result in results:
+                if not result['sent']:
+                    logging.error(
+                        f'Timesheet email to {result["to_emails"][0]} failed: {result["error"]}')
+            logging.info(
+                f'{sum(result["sent"] for result in results)} of {len(results)} timesheet emails sent')
+
+    logging.info(f'HTTP client stats: {json.dumps(get_stats())}')
+
+
+if __name__ == '__main__':
+    main()
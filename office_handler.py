@@ -1,14 +1,25 @@
 import base64
 import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
 
+import http_client
+import token_cache
+
 script_path = Path(__file__).resolve()
 script_parent = script_path.parent
 
 # Constants and configurations
 OFFICE_CREDENTIALS_FILE = script_parent / 'auth' / 'credentials_office.json'
+LOGIN_BASE_URL = 'https://login.microsoftonline.com'
+GRAPH_BASE_URL = 'https://graph.microsoft.com/v1.0'
+# Larger attachments go through an upload session, Graph rejects inline attachments over 3 MB
+INLINE_ATTACHMENT_LIMIT = 3 * 1024 * 1024
+# Upload session chunks must be a multiple of 320 KiB
+UPLOAD_CHUNK_SIZE = 10 * 320 * 1024
 
 
 def read_json(filename):
@@ -34,35 +45,140 @@ def get_email_details(filename):
     return sender_email, recipient_emails, subject, body
 
 
+def get_recipient_groups(filename):
+    # Optional recipient_groups list, each group gets its own email
+    email = read_json(filename)
+    return email.get('recipient_groups') or [email['recipient_emails']]
+
+
 def get_access_token(tenant_id, client_id, client_secret):
-    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+    token_url = f"{LOGIN_BASE_URL}/{tenant_id}/oauth2/v2.0/token"
     data = {
         'grant_type': 'client_credentials',
         'client_id': client_id,
         'client_secret': client_secret,
         'scope': 'https://graph.microsoft.com/.default'
     }
-    response = requests.post(token_url, data=data)
-    if response.status_code == 200:
-        return response.json()['access_token']
-    else:
-        print(f"Failed to obtain access token: {response.text}")
+
+    def fetch_token():
+        response = http_client.post(token_url, data=data)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Failed to obtain access token: {response.text}")
+            return None
+
+    # Reuse the cached token across emails until shortly before it expires
+    return token_cache.get_token(token_cache.cache_key('graph', data),
+                                 fetch_token)
+
+
+# Function to zip an attachment next to the original, compressed files are returned as is
+def compress_attachment(attachment_path):
+    attachment_path = Path(attachment_path)
+    if attachment_path.suffix in ('.gz', '.zip', '.parquet', '.arrow'):
+        return attachment_path
+    zip_path = attachment_path.with_name(attachment_path.name + '.zip')
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.write(attachment_path, attachment_path.name)
+    return zip_path
+
+
+# Function to stream an attachment from disk into an upload session chunk by chunk
+def upload_attachment(upload_url, attachment_path, chunk_size=UPLOAD_CHUNK_SIZE):
+    size = attachment_path.stat().st_size
+    with open(attachment_path, 'rb') as file:
+        offset = 0
+        while offset < size:
+            chunk = file.read(chunk_size)
+            # The upload URL is pre-authenticated, no Authorization header is sent
+            response = http_client.request(
+                'PUT',
+                upload_url,
+                data=chunk,
+                headers={
+                    "Content-Type": "application/octet-stream",
+                    "Content-Range":
+                    f"bytes {offset}-{offset + len(chunk) - 1}/{size}"
+                })
+            if response.status_code not in (200, 201):
+                print(f"Failed to upload attachment: {response.text}")
+                return False
+            offset += len(chunk)
+    return True
+
+
+# Function to build an inline file attachment for a message
+def file_attachment(attachment_path):
+    with open(attachment_path, 'rb') as file:
+        content = base64.b64encode(file.read()).decode('utf-8')
+    return {
+        "@odata.type": "#microsoft.graph.fileAttachment",
+        "name": attachment_path.name,
+        "contentBytes": content
+    }
+
+
+# Function to send a message with large attachments: draft, attachments, send
+def send_with_upload_session(user_url, headers, message, attachment_paths):
+    response = http_client.post(user_url + "/messages",
+                                headers=headers,
+                                json=message)
+    if response.status_code != 201:
+        print(f"Failed to create draft: {response.text}")
         return None
+    message_url = user_url + "/messages/" + response.json()['id']
+
+    for attachment_path in attachment_paths:
+        size = attachment_path.stat().st_size
+        # Small attachments are added to the draft directly, large ones are streamed
+        if size <= INLINE_ATTACHMENT_LIMIT:
+            response = http_client.post(message_url + "/attachments",
+                                        headers=headers,
+                                        json=file_attachment(attachment_path))
+            if response.status_code != 201:
+                print(f"Failed to add attachment: {response.text}")
+                return None
+            continue
+        response = http_client.post(
+            message_url + "/attachments/createUploadSession",
+            headers=headers,
+            json={
+                "AttachmentItem": {
+                    "attachmentType": "file",
+                    "name": attachment_path.name,
+                    "size": size
+                }
+            })
+        if response.status_code != 201:
+            print(f"Failed to create upload session: {response.text}")
+            return None
+        if not upload_attachment(response.json()['uploadUrl'],
+                                 attachment_path):
+            return None
+
+    response = http_client.post(message_url + "/send", headers=headers)
+    if response.status_code == 202:
+        print("Email sent successfully!")
+        return True
+    print(f"Failed to send email: {response.text}")
+    return None
 
 
 def send_email(sender_email,
                recipient_emails,
                subject,
                body,
-               attachment_path=None):
+               attachment_path=None,
+               compress=False):
     # Get credentials from JSON files
     tenant_id, client_id, client_secret = get_office_credentials(
         OFFICE_CREDENTIALS_FILE)
 
-    # Obtain access token internally
+    # Obtain access token internally, cached between emails
     access_token = get_access_token(tenant_id, client_id, client_secret)
 
-    url = "https://graph.microsoft.com/v1.0/users/" + sender_email + "/sendMail"
+    user_url = GRAPH_BASE_URL + "/users/" + sender_email
     if access_token:
         headers = {
             "Authorization": "Bearer " + access_token,
@@ -77,39 +193,69 @@ def send_email(sender_email,
     for recipient_email in recipient_emails:
         to_recipients.append({"emailAddress": {"address": recipient_email}})
 
-    # Prepare attachment
-    attachments = []
-    if attachment_path:
-        with open(attachment_path, 'rb') as file:
-            content = base64.b64encode(file.read()).decode('utf-8')
-            attachments.append({
-                "@odata.type": "#microsoft.graph.fileAttachment",
-                "name": attachment_path.name,
-                "contentBytes": content
-            })
-
-    # Prepare payload
-    payload = {
-        "message": {
-            "subject": subject,
-            "body": {
-                "contentType": "Text",
-                "content": body
-            },
-            "toRecipients": to_recipients
-        }
+    # Prepare message
+    message = {
+        "subject": subject,
+        "body": {
+            "contentType": "Text",
+            "content": body
+        },
+        "toRecipients": to_recipients
     }
 
-    # Add attachments if available
-    if attachments:
-        payload['message']['attachments'] = attachments
+    # Prepare attachments, a single path or a list of paths, zipped first to keep the Graph payload small
+    if isinstance(attachment_path, (str, Path)):
+        attachment_paths = [attachment_path]
+    else:
+        attachment_paths = list(attachment_path or [])
+    if compress:
+        attachment_paths = [compress_attachment(path) for path in attachment_paths]
+    attachment_paths = [Path(path) for path in attachment_paths]
+    if sum(path.stat().st_size
+           for path in attachment_paths) > INLINE_ATTACHMENT_LIMIT:
+        return send_with_upload_session(user_url, headers, message,
+                                        attachment_paths)
+    if attachment_paths:
+        message['attachments'] = [
+            file_attachment(path) for path in attachment_paths
+        ]
 
     # Send email
-    response = requests.post(url, headers=headers, json=payload)
+    response = http_client.post(user_url + "/sendMail",
+                                headers=headers,
+                                json={"message": message})
     if response.status_code == 202:
         print("Email sent successfully!")
+        return True
     else:
         print(f"Failed to send email: {response.text}")
+        return None
+
+
+def send_emails(emails, max_workers=4):
+    '''Send several emails concurrently
+
+    Args:
+        emails (list[dict]): Keyword arguments of send_email for each email,
+            attachment_path may be a single path or a list of paths
+        max_workers (int): Number of emails in flight at once
+
+    Returns:
+        list: send_email result for each email in the same order, None for failures
+    '''
+    def send(email):
+        try:
+            return send_email(**email)
+        except requests.RequestException as error:
+            print(f"Failed to send email: {error}")
+            return None
+        except OSError as error:
+            # Unreadable attachment, only this email fails
+            print(f"Failed to prepare attachment: {error}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(send, emails))
 
 
 if __name__ == '__main__':
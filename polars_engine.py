@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from calendar_rules import DEFAULT_RULES
+from report_generator import parse_buffers
+
+BUSINESS_START = pl.duration(hours=9)
+BUSINESS_END = pl.duration(hours=18)
+# Columns that are categoricals in the pandas shift report
+CATEGORY_COLUMNS = ['Name', 'Position', 'Pos_id', 'Title', 'Notes']
+SHIFT_REPORT_COLUMNS = [
+    'Shift_id', 'Name', 'Position', 'Pos_id', 'Title', 'Start_date',
+    'End_date', 'Employee_hours', 'Shift_hours', 'Employee_id', 'Notes',
+    'Break', 'Weekday_hours', 'Weekend_hours', 'Overtime'
+]
+OFFSET = r'(Z|[+-]\d\d:?\d\d)$'
+
+
+def _wall_clock(column: str, timezone: str | None) -> pl.Expr:
+    '''Parse timestamps into local wall times the same way as report_generator._to_datetime64'''
+    text = pl.col(column).str.replace('T', ' ', literal=True)
+    # The offset is dropped for the wall clock, fractional seconds are kept
+    local = text.str.replace(OFFSET, '').str.to_datetime(
+        '%Y-%m-%d %H:%M:%S%.f', time_unit='ns')
+    if not timezone:
+        return local
+    # Timestamps with an offset are converted, naive ones are already local
+    converted = text.str.replace(r'Z$', '+00:00').str.to_datetime(
+        '%Y-%m-%d %H:%M:%S%.f%z', time_unit='ns',
+        strict=False).dt.convert_time_zone(timezone).dt.replace_time_zone(None)
+    return pl.when(text.str.contains(OFFSET)).then(converted).otherwise(local)
+
+
+def _hours(delta: pl.Expr) -> pl.Expr:
+    # polars divides by a scalar through its reciprocal, numpy divides exactly
+    # like report_generator._hours so both engines give the same floats
+    return delta.dt.total_nanoseconds().map_batches(
+        lambda nanoseconds: nanoseconds.to_numpy() / 1e9 / 3600,
+        return_dtype=pl.Float64,
+        is_elementwise=True)
+
+
+def _text(codes: np.ndarray, values: dict) -> pl.Series:
+    return pl.Series(list(values), dtype=pl.String).gather(codes)
+
+
+def parse_data(shifts_data: dict,
+               select_positions=None,
+               timezone: str | None = None) -> tuple:
+    '''Parse shift data into a shift level and an employee level frame
+
+    The buffers are filled by report_generator.parse_buffers, timestamps are
+    parsed by polars.
+
+    Args:
+        shifts_data (dict): Shift data dict received from API
+        select_positions (optional): Position ids to keep, other shifts are skipped
+        timezone (str | None): Convert timestamps with an offset to this timezone
+
+    Returns:
+        tuple (pl.LazyFrame, pl.LazyFrame): One row per shift with Start_date
+            and End_date, one row per employee with the shift_row it belongs to
+    '''
+    buffers = parse_buffers(shifts_data, select_positions)
+    shifts = pl.LazyFrame({
+        'shift_row': np.arange(len(buffers['shift_ids'])),
+        'Shift_id': buffers['shift_ids'],
+        'Position': _text(buffers['position_codes'], buffers['positions']),
+        'Pos_id': _text(buffers['pos_id_codes'], buffers['pos_ids']),
+        'Title': _text(buffers['title_codes'], buffers['titles']),
+        'start_timestamp': pl.Series(buffers['shift_starts'], dtype=pl.String),
+        'end_timestamp': pl.Series(buffers['shift_ends'], dtype=pl.String),
+        'Shift_hours': buffers['shift_hours'],
+        'Notes': _text(buffers['note_codes'], buffers['notes'])
+    }).with_columns(Start_date=_wall_clock('start_timestamp', timezone),
+                    End_date=_wall_clock('end_timestamp', timezone))
+    employees = pl.LazyFrame({
+        'shift_row': buffers['row_shift'],
+        'Name': _text(buffers['name_codes'], buffers['names']),
+        'Employee_hours': buffers['employee_hours'],
+        'Employee_id': buffers['employee_ids']
+    })
+    return shifts, employees
+
+
+def _overtime(shift_start: pl.Expr, shift_end: pl.Expr) -> pl.Expr:
+    '''Expression version of report_generator.calculate_overtime_vectorized'''
+    day = shift_start.dt.truncate('1d')
+    fraction = shift_start - shift_start.dt.truncate('1s')
+    bau_start = day + BUSINESS_START + fraction
+    bau_end = day + BUSINESS_END + fraction
+    before_bau = _hours(bau_start - shift_start).clip(lower_bound=0)
+    after_bau = _hours(shift_end - bau_end).clip(lower_bound=0)
+    return pl.when((shift_start >= bau_end) | (shift_end <= bau_start)).then(
+        _hours(shift_end - shift_start)).otherwise(before_bau + after_bau)
+
+
+def separate_hours(shifts: pl.LazyFrame) -> pl.LazyFrame:
+    '''Add weekday_hours, weekend_hours and overtime like report_generator.separate_hours_vectorized'''
+    start = pl.col('Start_date')
+    end = pl.col('End_date')
+    midnight = end.dt.truncate('1d') + (end - end.dt.truncate('1s'))
+    total = _hours(end - start)
+    after_midnight = _hours(end - midnight)
+    before_midnight = _hours(midnight - start)
+
+    # dt.weekday is 1 for Monday and 7 for Sunday
+    start_weekday = start.dt.weekday() <= 5
+    end_weekday = end.dt.weekday() <= 5
+    only_weekday = start_weekday & end_weekday
+    only_weekend = ~start_weekday & ~end_weekday
+    weekday_to_weekend = start_weekday & ~end_weekday
+
+    def select(weekday, weekend, weekday_to_weekend_value, otherwise):
+        return pl.when(only_weekday).then(weekday).when(only_weekend).then(
+            weekend).when(weekday_to_weekend).then(
+                weekday_to_weekend_value).otherwise(otherwise)
+
+    return shifts.with_columns(
+        weekday_hours=select(total, 0.0, before_midnight, after_midnight),
+        weekend_hours=select(0.0, total, after_midnight, before_midnight),
+        overtime=select(_overtime(start, end), total,
+                        _overtime(start, midnight) + after_midnight,
+                        before_midnight + _overtime(midnight, end)))
+
+
+def _nanoseconds(offset) -> int:
+    return int(np.timedelta64(offset, 'ns').astype(np.int64))
+
+
+def separate_hours_calendar(shifts: pl.LazyFrame,
+                            calendar: dict) -> pl.LazyFrame:
+    '''Add weekday_hours, weekend_hours and overtime like report_generator.separate_hours_calendar'''
+    start = pl.col('Start_date')
+    end = pl.col('End_date')
+    default_start = _nanoseconds(calendar['business_start'])
+    default_end = _nanoseconds(calendar['business_end'])
+    position_start = {
+        pos_id: _nanoseconds(hours[0])
+        for pos_id, hours in calendar['position_hours'].items()
+    }
+    position_end = {
+        pos_id: _nanoseconds(hours[1])
+        for pos_id, hours in calendar['position_hours'].items()
+    }
+    weekend_days = [day + 1 for day in np.flatnonzero(calendar['weekend'])]
+    holidays = calendar['holidays'].astype('datetime64[D]').tolist()
+
+    # One segment per shift and day, a shift ending exactly at midnight does not touch the next day
+    first_day = start.dt.date()
+    last_day = pl.max_horizontal((end - pl.duration(nanoseconds=1)).dt.date(),
+                                 first_day)
+    segments = shifts.select(
+        'shift_row', 'Start_date', 'End_date',
+        pl.col('Pos_id').replace_strict(position_start,
+                                        default=default_start,
+                                        return_dtype=pl.Int64).alias(
+                                            'business_start'),
+        pl.col('Pos_id').replace_strict(position_end,
+                                        default=default_end,
+                                        return_dtype=pl.Int64).alias(
+                                            'business_end'),
+        pl.date_ranges(first_day, last_day).alias('day')).explode('day')
+
+    day_start = pl.col('day').cast(pl.Datetime('ns'))
+    segment_start = pl.max_horizontal(start, day_start)
+    segment_end = pl.min_horizontal(end, day_start + pl.duration(days=1))
+    bau_start = pl.max_horizontal(
+        segment_start,
+        day_start + pl.duration(nanoseconds=pl.col('business_start')))
+    bau_end = pl.min_horizontal(
+        segment_end, day_start + pl.duration(nanoseconds=pl.col('business_end')))
+    segments = segments.with_columns(
+        duration=_hours(segment_end - segment_start),
+        bau_hours=_hours(bau_end - bau_start).clip(lower_bound=0),
+        off_day=pl.col('day').dt.weekday().is_in(weekend_days)
+        | pl.col('day').is_in(holidays))
+
+    # Everything outside business hours of working days is overtime
+    duration = pl.col('duration')
+    off_day = pl.col('off_day')
+    hours = segments.group_by('shift_row').agg(
+        weekday_hours=pl.when(off_day).then(0.0).otherwise(duration).sum(),
+        weekend_hours=pl.when(off_day).then(duration).otherwise(0.0).sum(),
+        overtime=(duration -
+                  pl.when(off_day).then(0.0).otherwise(pl.col('bau_hours'))).sum())
+    return shifts.join(hours, on='shift_row', how='left')
+
+
+def apply_break_rules(shift_report: pl.LazyFrame,
+                      breaks: list) -> pl.LazyFrame:
+    '''Add the Break column and deduct missing breaks, see report_generator.apply_break_rules'''
+    shift_report = shift_report.with_columns(
+        Break=pl.col('Shift_hours') - pl.col('Employee_hours'))
+    for rule in breaks:
+        condition = pl.col('Break') == 0
+        if 'pos_ids' in rule:
+            condition &= pl.col('Pos_id').is_in(list(rule['pos_ids']))
+        if 'titles' in rule:
+            condition &= pl.col('Title').is_in(list(rule['titles']))
+        shift_report = shift_report.with_columns(
+            Employee_hours=pl.when(condition).then(
+                pl.col('Employee_hours') - rule['hours']).otherwise(
+                    pl.col('Employee_hours')),
+            Break=pl.when(condition).then(pl.lit(rule['hours'],
+                                                 pl.Float64)).otherwise(
+                                                     pl.col('Break')))
+    return shift_report
+
+
+def shift_report_query(shifts_data: dict,
+                       select_positions=None,
+                       calendar: dict | None = None) -> pl.LazyFrame:
+    '''Return the lazy query of the shift report, columns match report_generator.generate_shift_report
+
+    The hours are computed once per shift and joined to the employee rows,
+    polars runs the query on all cores.
+    '''
+    shifts, employees = parse_data(shifts_data, select_positions, calendar
+                                   and calendar['timezone'])
+    if calendar is None:
+        shifts = separate_hours(shifts)
+        breaks = DEFAULT_RULES['breaks']
+    else:
+        shifts = separate_hours_calendar(shifts, calendar)
+        breaks = calendar['breaks']
+    shift_report = employees.join(shifts,
+                                  on='shift_row',
+                                  how='left',
+                                  maintain_order='left')
+
+    # Account for missing breaks
+    return apply_break_rules(shift_report, breaks).with_columns(
+        Weekday_hours=pl.col('weekday_hours') - pl.col('Break'),
+        Weekend_hours=pl.col('weekend_hours'),
+        Overtime=pl.col('overtime')).select(SHIFT_REPORT_COLUMNS)
+
+
+def standby_report_query(shift_report: pl.LazyFrame,
+                         select_positions) -> pl.LazyFrame:
+    '''Return the lazy per employee totals of report_generator.generate_standby_report, unrounded'''
+    return shift_report.filter(pl.col('Pos_id').is_in(
+        list(select_positions))).group_by('Name').agg(
+            Number_of_shifts=pl.col('Position').count().cast(pl.Int64),
+            Total_hours=pl.col('Employee_hours').sum(),
+            Total_weekday_hours=pl.col('Weekday_hours').sum(),
+            Total_weekend_hours=pl.col('Weekend_hours').sum()).sort('Name')
+
+
+def to_pandas(frame: pl.DataFrame) -> pd.DataFrame:
+    '''Convert a polars frame column by column, pyarrow is not needed
+
+    Text columns of the shift report become categoricals with sorted
+    categories as in report_generator.parse_data_columnar.
+    '''
+    columns = {}
+    for series in frame.get_columns():
+        values = series.to_numpy()
+        if series.name in CATEGORY_COLUMNS:
+            values = pd.Categorical(values)
+        columns[series.name] = values
+    return pd.DataFrame(columns, index=pd.RangeIndex(frame.height))
@@ -1,5 +1,17 @@
+from array import array
+from itertools import islice
+
+import numpy as np
 import pandas as pd
 
+from calendar_rules import DEFAULT_RULES
+from instrumentation import stage
+
+BUSINESS_START = np.timedelta64(9, 'h')
+BUSINESS_END = np.timedelta64(18, 'h')
+# pandas is the default, polars is optional and imported only when selected
+ENGINES = ('pandas', 'polars')
+
 
 def parse_data(shifts_data: dict) -> pd.DataFrame:
     '''Parse shift data into pandas DataFrame
@@ -47,6 +59,176 @@ def parse_data(shifts_data: dict) -> pd.DataFrame:
     return pd.DataFrame(data_list)
 
 
+def _categorical(codes: np.ndarray, categories: dict) -> pd.Categorical:
+    '''Build a Categorical from integer codes with lexically sorted categories
+
+    Args:
+        codes (np.ndarray): Integer codes indexing into categories
+        categories (dict): Mapping of value to code in order of first appearance
+
+    Returns:
+        pd.Categorical: Categorical with sorted categories so grouping order matches object columns
+    '''
+    values = np.array(list(categories), dtype=object)
+    order = np.argsort(values, kind='stable')
+    remap = np.empty(len(order), dtype=np.int32)
+    remap[order] = np.arange(len(order), dtype=np.int32)
+    return pd.Categorical.from_codes(
+        remap[codes], values[order])
+
+
+def _id(value) -> int:
+    # Ids may arrive as numbers or numeric strings, a missing employee id is -1
+    return -1 if value is None else int(value)
+
+
+def parse_buffers(shifts_data: dict, select_positions=None) -> dict:
+    '''Fill typed column buffers from shift data, shared by the pandas and polars engines
+
+    Shift level fields are stored once per shift, row_shift maps every
+    employee row to its shift. Text fields are integer codes into dicts of
+    value to code in order of first appearance.
+
+    Args:
+        shifts_data (dict): Shift data dict received from API
+        select_positions (optional): Position ids to keep, other shifts are skipped
+
+    Returns:
+        dict: shift_ids, shift_starts, shift_ends, shift_hours, position_codes,
+            pos_id_codes, title_codes, note_codes, row_shift, name_codes,
+            employee_ids, employee_hours arrays and names, positions, pos_ids,
+            titles, notes code dicts
+    '''
+    # Shift level buffers
+    shift_ids = array('q')
+    shift_starts = []
+    shift_ends = []
+    shift_hours = array('d')
+    position_codes = array('i')
+    pos_id_codes = array('i')
+    title_codes = array('i')
+    note_codes = array('i')
+
+    # Employee level buffers
+    row_shift = array('q')
+    name_codes = array('i')
+    employee_ids = array('q')
+    employee_hours = array('d')
+
+    names: dict = {}
+    positions: dict = {}
+    pos_ids: dict = {}
+    titles: dict = {}
+    notes: dict = {}
+
+    if select_positions is not None:
+        select_positions = set(select_positions)
+
+    for shift in shifts_data['data']:
+        if select_positions is not None and shift[
+                'schedule'] not in select_positions:
+            continue
+        shift_index = len(shift_ids)
+        shift_ids.append(_id(shift['id']))
+        shift_starts.append(shift['start_timestamp'])
+        shift_ends.append(shift['end_timestamp'])
+        pos_id_codes.append(pos_ids.setdefault(shift['schedule'],
+                                               len(pos_ids)))
+        shift_hours.append(shift['paidtime'])
+        position_codes.append(
+            positions.setdefault(shift['schedule_name'], len(positions)))
+        title_codes.append(titles.setdefault(shift['title'], len(titles)))
+        note_codes.append(
+            notes.setdefault(shift.get('notes') or '', len(notes)))
+
+        # Check if 'employees' key exists and is a list
+        employees = shift.get('employees')
+        if isinstance(employees, list):
+            for employee in employees:
+                row_shift.append(shift_index)
+                name_codes.append(
+                    names.setdefault(employee['name'], len(names)))
+                employee_ids.append(_id(employee.get('id')))
+                employee_hours.append(employee['paidtime'])
+
+        # Account for OnCall shifts
+        employees_on_call = shift.get('employeesOnCall')
+        if isinstance(employees_on_call, list):
+            for employee in employees_on_call:
+                row_shift.append(shift_index)
+                name_codes.append(
+                    names.setdefault(employee['name'], len(names)))
+                employee_ids.append(_id(employee.get('id')))
+                employee_hours.append(shift['paidtime'])
+
+    return {
+        'shift_ids': np.frombuffer(shift_ids, dtype=np.int64),
+        'shift_starts': shift_starts,
+        'shift_ends': shift_ends,
+        'shift_hours': np.frombuffer(shift_hours, dtype=np.float64),
+        'position_codes': np.frombuffer(position_codes, dtype=np.int32),
+        'pos_id_codes': np.frombuffer(pos_id_codes, dtype=np.int32),
+        'title_codes': np.frombuffer(title_codes, dtype=np.int32),
+        'note_codes': np.frombuffer(note_codes, dtype=np.int32),
+        'row_shift': np.frombuffer(row_shift, dtype=np.int64),
+        'name_codes': np.frombuffer(name_codes, dtype=np.int32),
+        'employee_ids': np.frombuffer(employee_ids, dtype=np.int64),
+        'employee_hours': np.frombuffer(employee_hours, dtype=np.float64),
+        'names': names,
+        'positions': positions,
+        'pos_ids': pos_ids,
+        'titles': titles,
+        'notes': notes
+    }
+
+
+def parse_data_columnar(shifts_data: dict,
+                        select_positions=None,
+                        timezone: str | None = None) -> pd.DataFrame:
+    '''Parse shift data into pandas DataFrame by filling typed column buffers
+
+    Shift level fields are stored once per shift and expanded to employee rows
+    with a single take. Name, Position, Pos_id and Title are categoricals,
+    Start_date and End_date are parsed once per shift into datetime64.
+
+    Args:
+        shifts_data (dict): Shift data dict received from API
+        select_positions (optional): Position ids to keep, other shifts are skipped
+        timezone (str | None): Convert timestamps with an offset to this timezone
+
+    Returns:
+        pd.DataFrame: Shifts DataFrame with the columns of parse_data plus Employee_id and Notes
+    '''
+    buffers = parse_buffers(shifts_data, select_positions)
+    rows = buffers['row_shift']
+    return pd.DataFrame({
+        'Shift_id':
+        buffers['shift_ids'][rows],
+        'Name':
+        _categorical(buffers['name_codes'], buffers['names']),
+        'Position':
+        _categorical(buffers['position_codes'][rows], buffers['positions']),
+        'Pos_id':
+        _categorical(buffers['pos_id_codes'][rows], buffers['pos_ids']),
+        'Title':
+        _categorical(buffers['title_codes'][rows], buffers['titles']),
+        'Start_date':
+        _to_datetime64(pd.Series(buffers['shift_starts'], dtype=object),
+                       timezone)[rows],
+        'End_date':
+        _to_datetime64(pd.Series(buffers['shift_ends'], dtype=object),
+                       timezone)[rows],
+        'Employee_hours':
+        buffers['employee_hours'],
+        'Shift_hours':
+        buffers['shift_hours'][rows],
+        'Employee_id':
+        buffers['employee_ids'],
+        'Notes':
+        _categorical(buffers['note_codes'][rows], buffers['notes']),
+    })
+
+
 def calculate_overtime(shift_start: pd.Timestamp,
                        shift_end: pd.Timestamp) -> float:
     '''Assuming only weekdays, return total overtime outside of business hours
@@ -138,6 +320,187 @@ def separate_hours(shift_start_dates: pd.Series,
     return weekday_hours, weekend_hours, overtime
 
 
+def _to_datetime64(dates: pd.Series, timezone: str | None = None) -> np.ndarray:
+    '''Convert a Series of timestamps into a datetime64[ns] array of local wall times
+
+    Args:
+        dates (pd.Series): Series of timestamps (strings or datetimes)
+        timezone (str | None): Timezone of the wall clock, timestamps without an offset are taken as already local
+
+    Returns:
+        np.ndarray: datetime64[ns] array
+    '''
+    dates = pd.to_datetime(pd.Series(dates))
+    if dates.dt.tz is not None:
+        if timezone:
+            dates = dates.dt.tz_convert(timezone)
+        # Weekdays and business hours are judged on the local wall clock
+        dates = dates.dt.tz_localize(None)
+    return dates.to_numpy(dtype='datetime64[ns]')
+
+
+def _hours(delta: np.ndarray) -> np.ndarray:
+    '''Convert timedelta64 array into float hours the same way as Timedelta.total_seconds() / 3600'''
+    return (delta.astype('timedelta64[ns]').astype(np.int64) / 1e9) / 3600
+
+
+def _weekday(dates: np.ndarray) -> np.ndarray:
+    '''Return weekday for each datetime64 value, Monday == 0 and Sunday == 6'''
+    # 1970-01-01 was a Thursday
+    return (dates.astype('datetime64[D]').astype(np.int64) + 3) % 7
+
+
+def calculate_overtime_vectorized(shift_start: np.ndarray,
+                                  shift_end: np.ndarray) -> np.ndarray:
+    '''Array version of calculate_overtime, business hours are taken from the start date
+
+    Args:
+        shift_start (np.ndarray): datetime64 array of shift starts
+        shift_end (np.ndarray): datetime64 array of shift ends
+
+    Returns:
+        np.ndarray: Total overtime for each pair
+    '''
+    # Timestamp.replace(hour, minute, second) keeps sub-second precision
+    day = shift_start.astype('datetime64[D]').astype(shift_start.dtype)
+    fraction = shift_start - shift_start.astype('datetime64[s]').astype(
+        shift_start.dtype)
+    bau_start = day + BUSINESS_START + fraction
+    bau_end = day + BUSINESS_END + fraction
+
+    outside = (shift_start >= bau_end) | (shift_end <= bau_start)
+    before_bau = np.maximum(0, _hours(bau_start - shift_start))
+    after_bau = np.maximum(0, _hours(shift_end - bau_end))
+    return np.where(outside, _hours(shift_end - shift_start),
+                    before_bau + after_bau)
+
+
+def separate_hours_vectorized(shift_start_dates: pd.Series,
+                              shift_end_dates: pd.Series) -> tuple:
+    '''Array version of separate_hours, computes all shifts at once with datetime64 arithmetic
+
+    Args:
+        shift_start_dates (pd.Series): Series of start dates for each shift
+        shift_end_dates (pd.Series): Series of end dates for each shift
+
+    Returns:
+        tuple (np.ndarray, np.ndarray, np.ndarray): weekday_hours, weekend_hours, overtime
+    '''
+    shift_start = _to_datetime64(shift_start_dates)
+    shift_end = _to_datetime64(shift_end_dates)
+
+    start_weekday = _weekday(shift_start) < 5
+    end_weekday = _weekday(shift_end) < 5
+    total = _hours(shift_end - shift_start)
+
+    # Shift crossing between weekday and weekend is split at the midnight of the end date
+    midnight = shift_end.astype('datetime64[D]').astype(shift_end.dtype) + (
+        shift_end - shift_end.astype('datetime64[s]').astype(shift_end.dtype))
+    after_midnight = _hours(shift_end - midnight)
+    before_midnight = _hours(midnight - shift_start)
+
+    only_weekday = start_weekday & end_weekday
+    only_weekend = ~start_weekday & ~end_weekday
+    weekday_to_weekend = start_weekday & ~end_weekday
+
+    weekday_hours = np.select(
+        [only_weekday, only_weekend, weekday_to_weekend],
+        [total, 0.0, before_midnight], after_midnight)
+    weekend_hours = np.select(
+        [only_weekday, only_weekend, weekday_to_weekend],
+        [0.0, total, after_midnight], before_midnight)
+    overtime = np.select(
+        [only_weekday, only_weekend, weekday_to_weekend], [
+            calculate_overtime_vectorized(shift_start, shift_end), total,
+            calculate_overtime_vectorized(shift_start, midnight) +
+            after_midnight
+        ], before_midnight + calculate_overtime_vectorized(midnight, shift_end))
+    return weekday_hours, weekend_hours, overtime
+
+
+def _position_hours(pos_ids: pd.Series, calendar: dict) -> tuple:
+    '''Return business start and end offsets for each row, looked up once per position'''
+    codes, categories = pd.factorize(pos_ids)
+    default = (calendar['business_start'], calendar['business_end'])
+    # Rows without a position (code -1) pick the default appended last
+    hours = [
+        calendar['position_hours'].get(str(pos_id), default)
+        for pos_id in categories
+    ] + [default]
+    business_start = np.array([start for start, _ in hours],
+                              dtype='timedelta64[ns]')
+    business_end = np.array([end for _, end in hours], dtype='timedelta64[ns]')
+    return business_start[codes], business_end[codes]
+
+
+def separate_hours_calendar(shift_start_dates: pd.Series,
+                            shift_end_dates: pd.Series, pos_ids: pd.Series,
+                            calendar: dict) -> tuple:
+    '''Split shifts into weekday, weekend and overtime hours with compiled calendar rules
+
+    Each shift is cut into one segment per calendar day it touches, so shifts
+    spanning several midnights are split on every one of them. Holidays count
+    as weekend days and business hours are taken from the shift position.
+
+    Args:
+        shift_start_dates (pd.Series): Series of start dates for each shift
+        shift_end_dates (pd.Series): Series of end dates for each shift
+        pos_ids (pd.Series): Position id of each shift
+        calendar (dict): Rules compiled by calendar_rules.compile_rules
+
+    Returns:
+        tuple (np.ndarray, np.ndarray, np.ndarray): weekday_hours, weekend_hours, overtime
+    '''
+    shift_start = _to_datetime64(shift_start_dates)
+    shift_end = _to_datetime64(shift_end_dates)
+    business_start, business_end = _position_hours(pos_ids, calendar)
+
+    # A shift ending exactly at midnight does not touch the next day
+    first_day = shift_start.astype('datetime64[D]')
+    last_day = np.maximum(
+        (shift_end - np.timedelta64(1, 'ns')).astype('datetime64[D]'),
+        first_day)
+    days = (last_day - first_day).astype(np.int64) + 1
+
+    # One segment per shift and day
+    segment_shift = np.repeat(np.arange(len(shift_start)), days)
+    day_offset = np.arange(len(segment_shift)) - np.repeat(
+        np.cumsum(days) - days, days)
+    segment_day = first_day[segment_shift] + day_offset
+    day_start = segment_day.astype('datetime64[ns]')
+    segment_start = np.maximum(shift_start[segment_shift], day_start)
+    segment_end = np.minimum(shift_end[segment_shift],
+                             day_start + np.timedelta64(1, 'D'))
+    duration = _hours(segment_end - segment_start)
+
+    off_day = calendar['weekend'][_weekday(segment_day)] | np.isin(
+        segment_day, calendar['holidays'])
+    bau_start = np.maximum(segment_start,
+                           day_start + business_start[segment_shift])
+    bau_end = np.minimum(segment_end, day_start + business_end[segment_shift])
+    bau_hours = np.where(off_day, 0.0, np.maximum(0, _hours(bau_end - bau_start)))
+
+    def per_shift(values):
+        return np.bincount(segment_shift,
+                           weights=values,
+                           minlength=len(shift_start))
+
+    weekday_hours = per_shift(np.where(off_day, 0.0, duration))
+    weekend_hours = per_shift(np.where(off_day, duration, 0.0))
+    # Everything outside business hours of working days is overtime
+    overtime = per_shift(duration - bau_hours)
+    return weekday_hours, weekend_hours, overtime
+
+
+def _isin(column: pd.Series, values) -> np.ndarray:
+    '''Return a boolean mask of rows whose value is in values, compared on integer codes for categoricals'''
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        value_codes = column.cat.categories.get_indexer(list(values))
+        return np.isin(column.cat.codes.to_numpy(),
+                       value_codes[value_codes >= 0])
+    return column.isin(values).to_numpy()
+
+
 def filter_include(df: pd.DataFrame, select_positions: tuple) -> pd.DataFrame:
     '''Return filtered Series where position includes given position names
 
@@ -148,45 +511,126 @@ def filter_include(df: pd.DataFrame, select_positions: tuple) -> pd.DataFrame:
     Returns:
         pd.DataFrame: Filtered Series
     '''
-    filtered_df = df[df['Pos_id'].isin(select_positions)]
+    filtered_df = df[_isin(df['Pos_id'], select_positions)]
     return pd.DataFrame(filtered_df)
 
 
-def generate_shift_report(shifts_data):
-    # Process shifts_data as needed
-    shift_report = parse_data(shifts_data)
+def apply_break_rules(shift_report: pd.DataFrame, breaks: list) -> None:
+    '''Add the Break column and deduct missing breaks, one vectorized mask per rule
 
+    A rule matches rows without a recorded break, optionally limited to
+    pos_ids and titles, the first matching rule sets the break hours.
+    '''
+    shift_report[
+        'Break'] = shift_report['Shift_hours'] - shift_report['Employee_hours']
+    for rule in breaks:
+        condition = (shift_report['Break'] == 0).to_numpy()
+        if 'pos_ids' in rule:
+            condition &= _isin(shift_report['Pos_id'], rule['pos_ids'])
+        if 'titles' in rule:
+            condition &= _isin(shift_report['Title'], rule['titles'])
+        shift_report.loc[condition, 'Employee_hours'] -= rule['hours']
+        shift_report.loc[condition, 'Break'] = rule['hours']
+
+
+def add_shift_hours(shift_report: pd.DataFrame,
+                    calendar: dict | None = None) -> pd.DataFrame:
+    '''Add Break, Weekday_hours, Weekend_hours and Overtime columns to a parsed shift report
+
+    Args:
+        shift_report (pd.DataFrame): Shifts DataFrame from parse_data_columnar
+        calendar (dict | None): Rules compiled by calendar_rules.compile_rules,
+            None keeps the 9:00 to 18:00 split of separate_hours
+
+    Returns:
+        pd.DataFrame: The same DataFrame with break corrected hour columns
+    '''
     # Calculate weekday and weekend hours for each shift
     start_dates = shift_report.loc[:, 'Start_date']
     end_dates = shift_report.loc[:, 'End_date']
 
-    weekday_hours, weekend_hours, overtime = separate_hours(
-        start_dates, end_dates)
+    if calendar is None:
+        weekday_hours, weekend_hours, overtime = separate_hours_vectorized(
+            start_dates, end_dates)
+        breaks = DEFAULT_RULES['breaks']
+    else:
+        weekday_hours, weekend_hours, overtime = separate_hours_calendar(
+            start_dates, end_dates, shift_report['Pos_id'], calendar)
+        breaks = calendar['breaks']
 
-    # Add additional columns to shift_report
-    shift_report[
-        'Break'] = shift_report['Shift_hours'] - shift_report['Employee_hours']
     # Account for missing breaks
-    condition = (shift_report['Pos_id'].isin(['3110228', '3115140'])) & (
-        shift_report['Title'] == 'Morning/Day') & (shift_report['Break'] == 0)
-    shift_report.loc[condition, 'Employee_hours'] -= 9.0
-    shift_report.loc[condition, 'Break'] = 9.0
+    apply_break_rules(shift_report, breaks)
 
     shift_report['Weekday_hours'] = weekday_hours - shift_report['Break']
     shift_report['Weekend_hours'] = weekend_hours
     shift_report['Overtime'] = overtime
-    print(shift_report)
+    return shift_report
+
+
+def _polars_engine():
+    try:
+        import polars_engine
+    except ImportError as error:
+        raise RuntimeError(
+            f'The polars engine needs polars (pip install polars): {error}')
+    return polars_engine
+
+
+def as_pandas(shift_report) -> pd.DataFrame:
+    '''Return the shift report as a pandas DataFrame, polars engine reports are converted'''
+    if isinstance(shift_report, pd.DataFrame):
+        return shift_report
+    return _polars_engine().to_pandas(shift_report)
+
+
+def generate_shift_report(shifts_data,
+                          select_positions=None,
+                          calendar=None,
+                          verbose=True,
+                          engine='pandas'):
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine}, use one of {", ".join(ENGINES)}')
+    if engine == 'polars':
+        # One lazy query from parsing to break rules, run on all cores
+        polars_engine = _polars_engine()
+        with stage('separate_hours') as record:
+            shift_report = polars_engine.shift_report_query(
+                shifts_data, select_positions, calendar).collect()
+            record['rows'] = len(shift_report)
+        if verbose:
+            print(shift_report)
+        return shift_report
+
+    # Process shifts_data as needed, dropping unselected positions before the hour split
+    with stage('parse_data') as record:
+        shift_report = parse_data_columnar(
+            shifts_data, select_positions, calendar and calendar['timezone'])
+        record['rows'] = len(shift_report)
+
+    with stage('separate_hours', rows=len(shift_report)):
+        shift_report = add_shift_hours(shift_report, calendar)
+    if verbose:
+        print(shift_report)
     return shift_report
 
 
 def generate_standby_report(shift_report, select_positions):
-    # Grouping by 'Name' and aggregating shift count, total hours, weekday hours, and weekend hours
-    filtered_shift_report = filter_include(shift_report, select_positions)
-    standby_report = filtered_shift_report.groupby('Name').agg(
-        Number_of_shifts=('Position', 'count'),
-        Total_hours=('Employee_hours', 'sum'),
-        Total_weekday_hours=('Weekday_hours', 'sum'),
-        Total_weekend_hours=('Weekend_hours', 'sum')).reset_index()
+    if isinstance(shift_report, pd.DataFrame):
+        # Grouping by 'Name' and aggregating shift count, total hours, weekday hours, and weekend hours
+        filtered_shift_report = filter_include(shift_report, select_positions)
+        standby_report = filtered_shift_report.groupby(
+            'Name', observed=True).agg(
+                Number_of_shifts=('Position', 'count'),
+                Total_hours=('Employee_hours', 'sum'),
+                Total_weekday_hours=('Weekday_hours', 'sum'),
+                Total_weekend_hours=('Weekend_hours', 'sum')).reset_index()
+    else:
+        # Shift reports of the polars engine are aggregated by polars, the
+        # small result is rounded below with pandas like the default engine
+        polars_engine = _polars_engine()
+        standby_report = polars_engine.to_pandas(
+            polars_engine.standby_report_query(shift_report.lazy(),
+                                               select_positions).collect())
 
     # Formatting the columns with floating-point numbers to two decimal places
     standby_report['Total_hours'] = standby_report['Total_hours'].round(2)
@@ -195,3 +639,75 @@ def generate_standby_report(shift_report, select_positions):
     standby_report['Total_weekend_hours'] = standby_report[
         'Total_weekend_hours'].round(2)
     return standby_report
+
+
+def generate_standby_reports(shift_report: pd.DataFrame, jobs: list) -> list:
+    '''Slice one shift report into a standby report per job without re-parsing
+
+    Args:
+        shift_report (pd.DataFrame): Shift report covering the span of all jobs
+        jobs (list): (start_date, end_date, select_positions) tuples, shifts are assigned by start date
+
+    Returns:
+        list[pd.DataFrame]: Standby report for each job in the same order
+    '''
+    start_days = _to_datetime64(
+        shift_report['Start_date']).astype('datetime64[D]')
+    standby_reports = []
+    for start_date, end_date, select_positions in jobs:
+        in_period = (start_days >= np.datetime64(start_date, 'D')) & (
+            start_days <= np.datetime64(end_date, 'D'))
+        standby_reports.append(
+            generate_standby_report(shift_report[in_period], select_positions))
+    return standby_reports
+
+
+def generate_standby_report_streaming(shifts,
+                                      select_positions,
+                                      batch_size: int = 10000,
+                                      calendar: dict | None = None) -> pd.DataFrame:
+    '''Fold an iterable of shifts into the standby report batch by batch
+
+    Only one batch of rows and the running per employee totals are held in
+    memory, the result matches generate_standby_report on the full data.
+
+    Args:
+        shifts (Iterable[dict]): Shifts, e.g. from api_handler.iter_shifts
+        select_positions (tuple): Position ids to include
+        batch_size (int): Shifts parsed per batch
+        calendar (dict | None): Compiled calendar rules passed to add_shift_hours
+
+    Returns:
+        pd.DataFrame: Standby report
+    '''
+    totals: dict = {}
+    shifts = iter(shifts)
+    while True:
+        batch = list(islice(shifts, batch_size))
+        if not batch:
+            break
+        shift_report = add_shift_hours(
+            parse_data_columnar({'data': batch}, select_positions, calendar
+                                and calendar['timezone']), calendar)
+        partial = shift_report.groupby('Name', observed=True).agg(
+            shifts=('Position', 'count'),
+            employee_hours=('Employee_hours', 'sum'),
+            weekday_hours=('Weekday_hours', 'sum'),
+            weekend_hours=('Weekend_hours', 'sum'))
+        for name, *values in partial.itertuples(name=None):
+            running = totals.setdefault(name, [0, 0.0, 0.0, 0.0])
+            for index, value in enumerate(values):
+                running[index] += value
+
+    standby_report = pd.DataFrame(
+        [[name, *totals[name]] for name in sorted(totals)],
+        columns=[
+            'Name', 'Number_of_shifts', 'Total_hours', 'Total_weekday_hours',
+            'Total_weekend_hours'
+        ])
+    # Formatting the columns with floating-point numbers to two decimal places
+    for column in [
+            'Total_hours', 'Total_weekday_hours', 'Total_weekend_hours'
+    ]:
+        standby_report[column] = standby_report[column].round(2)
+    return standby_report
@@ -0,0 +1,343 @@
+import argparse
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from api_handler import get_access_token
+from report_generator import generate_shift_report, generate_standby_report
+from shift_store import (LEGACY_RULES_VERSION, configure_memory_cache, connect,
+                         data_version, get_shifts_cached,
+                         memory_cache_stats, refresh_shifts)
+from token_cache import configure as configure_token_cache
+
+import main
+
+# Constants and configurations
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json'
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class ReportService:
+    '''Standby reports of date ranges, cached by range, positions and data version
+
+    Every request refreshes the stale days of its range in the shift store
+    first, the latest fetch time of the range is the data version. Results of
+    an unchanged version are served from an LRU cache and identical requests
+    arriving while a report is computed wait for that computation.
+    '''
+
+    def __init__(self,
+                 credentials_file: Path,
+                 db_path: Path,
+                 max_age: datetime.timedelta,
+                 cache_entries: int = 64,
+                 calendar: dict | None = None,
+                 window_days: int | None = None):
+        self.credentials_file = credentials_file
+        self.db_path = db_path
+        self.max_age = max_age
+        self.cache_entries = cache_entries
+        self.calendar = calendar
+        self.rules_version = calendar['version'] if calendar else LEGACY_RULES_VERSION
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+        self._in_flight = {}
+        self.stats = {'requests': 0, 'hits': 0, 'misses': 0, 'shared': 0,
+                      'not_modified': 0, 'errors': 0}
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _single_flight(self, key: tuple, compute):
+        '''Run compute once for concurrent callers with the same key, all get its result'''
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.stats['shared'] += 1
+        if leader:
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+        return future.result()
+
+    def _refresh(self, start_date, end_date, select_positions):
+        # Stale days are fetched once for all requests of the same range
+        access_token = get_access_token(self.credentials_file)
+        schedule_filter = dict.fromkeys(select_positions)
+        connection = connect(self.db_path)
+        try:
+            if not refresh_shifts(connection,
+                                  start_date,
+                                  end_date,
+                                  access_token,
+                                  self.max_age,
+                                  schedule_filter,
+                                  window_days=self.window_days):
+                raise RuntimeError('Failed to fetch shift data')
+            return access_token, data_version(connection, start_date,
+                                              end_date)
+        finally:
+            connection.close()
+
+    def _compute(self, start_date, end_date, select_positions, access_token):
+        shifts_data = get_shifts_cached(start_date,
+                                        end_date,
+                                        access_token,
+                                        self.db_path,
+                                        self.max_age,
+                                        dict.fromkeys(select_positions),
+                                        window_days=self.window_days)
+        if not shifts_data or not shifts_data['data']:
+            raise RuntimeError('Shift data is empty')
+        shift_report = generate_shift_report(shifts_data,
+                                             select_positions,
+                                             self.calendar,
+                                             verbose=False)
+        return generate_standby_report(shift_report, select_positions)
+
+    def _lookup(self, key: tuple):
+        with self._lock:
+            report = self._cache.get(key)
+            if report is not None:
+                self._cache.move_to_end(key)
+            return report
+
+    def _store(self, key: tuple, report) -> None:
+        with self._lock:
+            self._cache[key] = report
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def validate(self, start_date: datetime.date, end_date: datetime.date,
+                 select_positions: list) -> tuple:
+        '''Refresh the stale days of the range and return its cache key and ETag
+
+        Nothing is computed, a conditional request can be answered from the ETag.
+
+        Returns:
+            tuple: (cache key, ETag without quotes, access token for report)
+        '''
+        range_key = (start_date, end_date, tuple(select_positions))
+        access_token, version = self._single_flight(
+            ('refresh', *range_key),
+            lambda: self._refresh(start_date, end_date, select_positions))
+        key = (*range_key, version, self.rules_version)
+        etag = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+        return key, etag, access_token
+
+    def build(self, key: tuple, access_token: str):
+        '''Return the standby report of a key from validate, computing it on a cache miss'''
+        report = self._lookup(key)
+        if report is not None:
+            self.count('hits')
+            return report
+        self.count('misses')
+        start_date, end_date, select_positions = key[0], key[1], list(key[2])
+
+        def compute():
+            # A follower of an earlier flight may already have stored it
+            report = self._lookup(key)
+            if report is None:
+                report = self._compute(start_date, end_date,
+                                       select_positions, access_token)
+                self._store(key, report)
+            return report
+
+        return self._single_flight(('report', *key), compute)
+
+    def report(self, start_date: datetime.date, end_date: datetime.date,
+               select_positions: list) -> tuple:
+        '''Return the standby report of the range and its ETag
+
+        Args:
+            start_date (datetime.date): Start of the period
+            end_date (datetime.date): End of the period, inclusive
+            select_positions (list): Position ids in report column order
+
+        Returns:
+            tuple: (standby report DataFrame, ETag without quotes)
+        '''
+        key, etag, access_token = self.validate(start_date, end_date,
+                                                select_positions)
+        return self.build(key, access_token), etag
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats, 'cached_reports': len(self._cache),
+                'in_flight': len(self._in_flight),
+                'shift_cache': memory_cache_stats()
+            }
+
+
+def parse_query(query: str) -> tuple:
+    '''Return start date, end date, positions and format of a /standby query string'''
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    try:
+        start_date = datetime.date.fromisoformat(params['start'])
+        end_date = datetime.date.fromisoformat(params['end'])
+    except KeyError as e:
+        raise BadRequest(f'Missing parameter {e}')
+    except ValueError:
+        raise BadRequest('Invalid date format. Use YYYY-MM-DD')
+    if end_date < start_date:
+        raise BadRequest('end must not be before start')
+
+    positions = params.get('positions')
+    select_positions = ([position.strip() for position in positions.split(',')
+                         if position.strip()]
+                        if positions else list(main.DEFAULT_POSITIONS))
+    if not select_positions:
+        raise BadRequest('No positions selected')
+
+    output_format = params.get('format', 'csv')
+    if output_format not in CONTENT_TYPES:
+        raise BadRequest(f'Unsupported format {output_format}, use csv or json')
+    return start_date, end_date, select_positions, output_format
+
+
+def render(report, output_format: str) -> bytes:
+    if output_format == 'json':
+        return report.to_json(orient='records', date_format='iso').encode()
+    return report.to_csv(index=False).encode()
+
+
+def make_handler(service: ReportService):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logging.info(f'{self.address_string()} {format % args}')
+
+        def _send(self, code, body=b'', content_type='application/json',
+                  headers={}):
+            self.send_response(code)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            if code != 304:
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if code != 304:
+                self.wfile.write(body)
+
+        def _send_json(self, code, obj):
+            self._send(code, json.dumps(obj, default=str).encode())
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/status':
+                return self._send_json(200, service.status())
+            if url.path != '/standby':
+                return self._send_json(404, {'error': 'Not found'})
+
+            service.count('requests')
+            try:
+                start_date, end_date, select_positions, output_format = parse_query(
+                    url.query)
+                key, etag, access_token = service.validate(
+                    start_date, end_date, select_positions)
+
+                # The format is part of the validator, csv and json bodies differ
+                etag = f'"{etag}-{output_format}"'
+                headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+                if etag in [tag.strip() for tag in self.headers.get(
+                        'If-None-Match', '').split(',')]:
+                    # Answered before the report is computed or looked up
+                    service.count('not_modified')
+                    return self._send(304, headers=headers)
+                report = service.build(key, access_token)
+            except BadRequest as e:
+                return self._send_json(400, {'error': str(e)})
+            except Exception as e:
+                service.count('errors')
+                logging.error(f'Report request failed: {e}')
+                return self._send_json(502, {'error': str(e)})
+            self._send(200, render(report, output_format),
+                       CONTENT_TYPES[output_format], headers)
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve standby reports over HTTP, '
+        'GET /standby?start=YYYY-MM-DD&end=YYYY-MM-DD&positions=id,id&format=csv|json')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--max_age_hours',
+                        type=float,
+                        default=24,
+                        help='Shifts fetched longer ago are fetched again')
+    parser.add_argument('--window_days',
+                        type=int,
+                        default=None,
+                        help='Fetch the range in windows of this many days')
+    parser.add_argument('--cache_entries',
+                        type=int,
+                        default=64,
+                        help='Reports kept in memory, least recently used are evicted')
+    parser.add_argument('--max_cached_shifts',
+                        type=int,
+                        default=500_000,
+                        help='Shifts kept in memory between requests')
+    parser.add_argument('--calendar_rules',
+                        type=Path,
+                        default=None,
+                        help='JSON file with business hours, holidays and break rules')
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=main.LOG_FILE,
+                        level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        encoding='utf-8')
+    calendar = None
+    if args.calendar_rules:
+        from calendar_rules import compile_rules, load_rules
+        try:
+            calendar = compile_rules(load_rules(args.calendar_rules))
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    configure_token_cache(main.TOKEN_CACHE_FILE)
+    configure_memory_cache(args.max_cached_shifts)
+
+    service = ReportService(main.CREDENTIALS_FILE,
+                            main.SHIFT_STORE_FILE,
+                            datetime.timedelta(hours=args.max_age_hours),
+                            args.cache_entries,
+                            calendar,
+                            args.window_days)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    logging.info(f'Report service listening on {args.host}:{args.port}')
+    print(f'Listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
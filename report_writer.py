@@ -0,0 +1,112 @@
+import gzip
+import importlib.util
+import io
+import time
+import zipfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+# pandas and pyarrow are imported only when a report is written, pyarrow is optional
+if TYPE_CHECKING:
+    import pandas as pd
+
+FORMATS = {
+    'csv': '.csv',
+    'csv.gz': '.csv.gz',
+    'zip': '.zip',
+    'parquet': '.parquet',
+    'arrow': '.arrow'
+}
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+CHUNK_ROWS = 100_000
+
+
+def check_format(output_format: str) -> None:
+    '''Raise RuntimeError if the format needs pyarrow and it is not installed'''
+    if output_format in COLUMNAR_FORMATS and importlib.util.find_spec(
+            'pyarrow') is None:
+        raise RuntimeError(
+            f'The {output_format} format needs pyarrow (pip install pyarrow)')
+
+
+def report_path(base_path: Path, output_format: str) -> Path:
+    '''Return the report file path for the format, base_path has no extension'''
+    return base_path.with_name(base_path.name + FORMATS[output_format])
+
+
+def _write_csv(text_file, comment: str, report: 'pd.DataFrame',
+               chunk_rows: int) -> None:
+    text_file.write('# ' + comment + '\n')
+    report.to_csv(text_file, index=False, chunksize=chunk_rows)
+
+
+def _record_batches(pa, report: 'pd.DataFrame', schema, chunk_rows: int):
+    for start in range(0, len(report), chunk_rows):
+        yield pa.RecordBatch.from_pandas(report.iloc[start:start + chunk_rows],
+                                         schema=schema,
+                                         preserve_index=False)
+
+
+def _write_columnar(path: Path, comment: str, report: 'pd.DataFrame',
+                    output_format: str, chunk_rows: int) -> None:
+    check_format(output_format)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise RuntimeError(
+            f'The {output_format} format needs a working pyarrow: {error}')
+    # The report comment travels in the schema metadata instead of a header line
+    schema = pa.Schema.from_pandas(report, preserve_index=False)
+    schema = schema.with_metadata({
+        **(schema.metadata or {}), b'comment': comment.encode('utf-8')
+    })
+    if output_format == 'parquet':
+        with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+            for batch in _record_batches(pa, report, schema, chunk_rows):
+                writer.write_batch(batch)
+    else:
+        with pa.OSFile(str(path), 'wb') as sink, pa.ipc.new_file(
+                sink, schema) as writer:
+            for batch in _record_batches(pa, report, schema, chunk_rows):
+                writer.write_batch(batch)
+
+
+def write_report(path: Path,
+                 comment: str,
+                 report: 'pd.DataFrame',
+                 output_format: str = 'csv',
+                 chunk_rows: int = CHUNK_ROWS) -> Path:
+    '''Write a report in the given format, chunk by chunk straight to the file
+
+    Args:
+        path (Path): Output file
+        comment (str): Description written as the first line of csv files
+        report (pd.DataFrame): Standby or shift report
+        output_format (str): One of FORMATS
+        chunk_rows (int): Rows converted and written at a time
+
+    Returns:
+        Path: Written file
+    '''
+    if output_format == 'csv':
+        with open(path, 'w', newline='') as f:
+            _write_csv(f, comment, report, chunk_rows)
+    elif output_format == 'csv.gz':
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+            _write_csv(f, comment, report, chunk_rows)
+    elif output_format == 'zip':
+        # The archive holds one csv named after the report
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            member_info = zipfile.ZipInfo(path.stem + '.csv',
+                                          time.localtime()[:6])
+            member_info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(member_info, 'w') as member:
+                with io.TextIOWrapper(member, encoding='utf-8',
+                                      newline='') as f:
+                    _write_csv(f, comment, report, chunk_rows)
+    elif output_format in COLUMNAR_FORMATS:
+        _write_columnar(path, comment, report, output_format, chunk_rows)
+    else:
+        raise ValueError(f'Unknown output format: {output_format}')
+    return path
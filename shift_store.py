@@ -0,0 +1,423 @@
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from api_handler import get_shifts
+from instrumentation import stage
+from report_generator import add_shift_hours, parse_data_columnar
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shifts (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    schedule TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shifts_date ON shifts (date, schedule);
+CREATE TABLE IF NOT EXISTS fetched_days (
+    date TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (date, scope)
+);
+CREATE TABLE IF NOT EXISTS standby_partials (
+    date TEXT NOT NULL,
+    name TEXT NOT NULL,
+    pos_id TEXT NOT NULL,
+    shifts INTEGER NOT NULL,
+    employee_hours REAL NOT NULL,
+    weekday_hours REAL NOT NULL,
+    weekend_hours REAL NOT NULL,
+    overtime REAL NOT NULL,
+    PRIMARY KEY (date, name, pos_id)
+);
+CREATE TABLE IF NOT EXISTS partial_days (
+    date TEXT PRIMARY KEY,
+    computed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+# Version of the partials computed without a rules file
+LEGACY_RULES_VERSION = 'legacy'
+
+# Shift ranges kept in memory by long running processes, disabled by default.
+# Used by get_shifts_cached only, standby reports are summed from the stored partials
+_memory_lock = threading.Lock()
+_memory_cache: OrderedDict = OrderedDict()
+_memory = {'max_shifts': 0, 'shifts': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+# Function to open the store and create the tables on first use
+def connect(db_path: Path) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+# Function to get the calendar date a shift is stored under
+def _shift_date(shift: dict) -> str:
+    return datetime.datetime.fromisoformat(str(
+        shift['start_timestamp'])).date().isoformat()
+
+
+# Function to build the freshness scope key for a positions filter
+def _scope(positions) -> str:
+    return ','.join(sorted(positions)) if positions else ''
+
+
+def _days(start_date: datetime.date, end_date: datetime.date) -> list[str]:
+    return [(start_date + datetime.timedelta(days=offset)).isoformat()
+            for offset in range((end_date - start_date).days + 1)]
+
+
+# Function to group sorted ISO dates into contiguous inclusive ranges
+def _day_ranges(days: list[str]) -> list[tuple]:
+    ranges = []
+    for day in map(datetime.date.fromisoformat, days):
+        if ranges and ranges[-1][1] + datetime.timedelta(days=1) == day:
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def stale_days(connection: sqlite3.Connection, start_date: datetime.date,
+               end_date: datetime.date, positions: dict,
+               max_age: datetime.timedelta) -> list[str]:
+    '''Return the days in the range that are missing from the store or older than max_age
+
+    Days fetched for all schedules are also fresh for any positions filter.
+    '''
+    fresh_since = time.time() - max_age.total_seconds()
+    rows = connection.execute(
+        'SELECT DISTINCT date FROM fetched_days '
+        'WHERE date BETWEEN ? AND ? AND scope IN (?, ?) AND fetched_at >= ?',
+        (start_date.isoformat(), end_date.isoformat(), '', _scope(positions),
+         fresh_since))
+    fresh = {row[0] for row in rows}
+    return [day for day in _days(start_date, end_date) if day not in fresh]
+
+
+def store_shifts(connection: sqlite3.Connection, start_date: datetime.date,
+                 end_date: datetime.date, positions: dict,
+                 shifts_data: dict) -> None:
+    '''Replace the stored shifts of the given days with a fresh API response'''
+    start, end = start_date.isoformat(), end_date.isoformat()
+    with connection:
+        # Shifts deleted or moved upstream must disappear from the refreshed days
+        if positions:
+            schedules = list(positions)
+            connection.execute(
+                'DELETE FROM shifts WHERE date BETWEEN ? AND ? AND schedule IN '
+                f'({", ".join("?" * len(schedules))})',
+                (start, end, *schedules))
+        else:
+            connection.execute(
+                'DELETE FROM shifts WHERE date BETWEEN ? AND ?', (start, end))
+        connection.executemany(
+            'INSERT OR REPLACE INTO shifts (id, date, schedule, data) '
+            'VALUES (?, ?, ?, ?)',
+            ((shift['id'], _shift_date(shift), str(shift['schedule']),
+              json.dumps(shift)) for shift in shifts_data.get('data') or []))
+        fetched_at = time.time()
+        connection.executemany(
+            'INSERT OR REPLACE INTO fetched_days (date, scope, fetched_at) '
+            'VALUES (?, ?, ?)',
+            ((day, _scope(positions), fetched_at)
+             for day in _days(start_date, end_date)))
+
+
+def load_shifts(connection: sqlite3.Connection, start_date: datetime.date,
+                end_date: datetime.date, positions: dict) -> dict:
+    '''Read stored shifts of the range in the same dict shape as get_shifts'''
+    query = 'SELECT data FROM shifts WHERE date BETWEEN ? AND ?'
+    params = [start_date.isoformat(), end_date.isoformat()]
+    if positions:
+        schedules = list(positions)
+        query += f' AND schedule IN ({", ".join("?" * len(schedules))})'
+        params += schedules
+    rows = connection.execute(query + ' ORDER BY date, id', params)
+    return {'data': [json.loads(row[0]) for row in rows]}
+
+
+def refresh_shifts(connection: sqlite3.Connection,
+                   start_date: datetime.date,
+                   end_date: datetime.date,
+                   access_token: str,
+                   max_age: datetime.timedelta,
+                   positions: dict = {},
+                   **fetch_kwargs) -> bool:
+    '''Fetch the missing or stale days of the range into the store, return False if a fetch failed'''
+    stale = stale_days(connection, start_date, end_date, positions, max_age)
+    for range_start, range_end in _day_ranges(stale):
+        shifts_data = get_shifts(range_start, range_end, access_token,
+                                 positions, **fetch_kwargs)
+        if shifts_data is None:
+            return False
+        store_shifts(connection, range_start, range_end, positions,
+                     shifts_data)
+    return True
+
+
+def configure_memory_cache(max_shifts: int) -> None:
+    '''Keep recently loaded shift ranges in memory, up to max_shifts shifts in total
+
+    Args:
+        max_shifts (int): Memory bound, least recently used ranges are evicted first, 0 disables the cache
+    '''
+    with _memory_lock:
+        _memory['max_shifts'] = max_shifts
+        _evict()
+
+
+def memory_cache_stats() -> dict:
+    '''Return entries, shifts, hits, misses and evictions of the in-memory cache'''
+    with _memory_lock:
+        return {'entries': len(_memory_cache), **_memory}
+
+
+def _evict() -> None:
+    while _memory_cache and _memory['shifts'] > _memory['max_shifts']:
+        _, (_, shifts_data) = _memory_cache.popitem(last=False)
+        _memory['shifts'] -= len(shifts_data['data'])
+        _memory['evictions'] += 1
+
+
+def data_version(connection: sqlite3.Connection, start_date: datetime.date,
+                 end_date: datetime.date) -> float | None:
+    '''Return the latest fetch time of the range, results computed before it are outdated'''
+    return connection.execute(
+        'SELECT MAX(fetched_at) FROM fetched_days WHERE date BETWEEN ? AND ?',
+        (start_date.isoformat(), end_date.isoformat())).fetchone()[0]
+
+
+def _recall(key: tuple, version: float | None) -> dict | None:
+    with _memory_lock:
+        entry = _memory_cache.get(key)
+        if entry is None or entry[0] != version:
+            _memory['misses'] += 1
+            return None
+        _memory_cache.move_to_end(key)
+        _memory['hits'] += 1
+        return entry[1]
+
+
+def _remember(key: tuple, version: float | None, shifts_data: dict) -> None:
+    with _memory_lock:
+        if len(shifts_data['data']) > _memory['max_shifts']:
+            return
+        previous = _memory_cache.pop(key, None)
+        if previous is not None:
+            _memory['shifts'] -= len(previous[1]['data'])
+        _memory_cache[key] = (version, shifts_data)
+        _memory['shifts'] += len(shifts_data['data'])
+        _evict()
+
+
+def get_shifts_cached(start_date: datetime.date,
+                      end_date: datetime.date,
+                      access_token: str,
+                      db_path: Path,
+                      max_age: datetime.timedelta = datetime.timedelta(
+                          hours=24),
+                      positions: dict = {},
+                      **fetch_kwargs) -> dict | None:
+    '''Return shifts of the range, fetching only missing or stale days from the API
+
+    Args:
+        start_date (datetime.date): Start of the period
+        end_date (datetime.date): End of the period, inclusive
+        access_token (str): Humanity access token
+        db_path (Path): SQLite store file
+        max_age (datetime.timedelta): Freshness window for stored days
+        positions (dict): Optional schedule filter passed to get_shifts
+        **fetch_kwargs: Extra arguments for get_shifts (e.g. window_days)
+
+    Returns:
+        dict | None: Shift data in the get_shifts shape, None if a fetch failed
+    '''
+    connection = connect(db_path)
+    try:
+        if not refresh_shifts(connection, start_date, end_date, access_token,
+                              max_age, positions, **fetch_kwargs):
+            return None
+        if not _memory['max_shifts']:
+            return load_shifts(connection, start_date, end_date, positions)
+
+        # Ranges loaded since their last fetch are served from memory
+        key = (str(db_path), start_date, end_date, _scope(positions))
+        version = data_version(connection, start_date, end_date)
+        shifts_data = _recall(key, version)
+        if shifts_data is None:
+            shifts_data = load_shifts(connection, start_date, end_date,
+                                      positions)
+            _remember(key, version, shifts_data)
+        return shifts_data
+    finally:
+        connection.close()
+
+
+# Function to find fetched days whose partials are missing or older than the shifts
+def _changed_days(connection: sqlite3.Connection, start_date: datetime.date,
+                  end_date: datetime.date) -> list[str]:
+    rows = connection.execute(
+        'SELECT fetched.date FROM ('
+        '    SELECT date, MAX(fetched_at) AS fetched_at FROM fetched_days'
+        '    WHERE date BETWEEN ? AND ? GROUP BY date) AS fetched '
+        'LEFT JOIN partial_days ON partial_days.date = fetched.date '
+        'WHERE partial_days.computed_at IS NULL '
+        'OR partial_days.computed_at < fetched.fetched_at '
+        'ORDER BY fetched.date', (start_date.isoformat(), end_date.isoformat()))
+    return [row[0] for row in rows]
+
+
+# Function to drop all partials when they were computed with other calendar rules
+def _check_rules_version(connection: sqlite3.Connection, version: str) -> None:
+    row = connection.execute(
+        "SELECT value FROM store_meta WHERE key = 'rules_version'").fetchone()
+    if row and row[0] == version:
+        return
+    with connection:
+        connection.execute('DELETE FROM standby_partials')
+        connection.execute('DELETE FROM partial_days')
+        connection.execute(
+            'INSERT OR REPLACE INTO store_meta (key, value) '
+            "VALUES ('rules_version', ?)", (version, ))
+
+
+def update_standby_partials(connection: sqlite3.Connection,
+                            start_date: datetime.date,
+                            end_date: datetime.date,
+                            calendar: dict | None = None) -> list[str]:
+    '''Recompute per employee, per position, per day aggregates for the changed days of the range
+
+    Partials computed with other calendar rules are discarded first.
+
+    Returns:
+        list[str]: Days that were recomputed
+    '''
+    _check_rules_version(
+        connection, calendar['version'] if calendar else LEGACY_RULES_VERSION)
+    changed = _changed_days(connection, start_date, end_date)
+    for range_start, range_end in _day_ranges(changed):
+        shifts_data = load_shifts(connection, range_start, range_end, {})
+        with stage('parse_data') as record:
+            shift_report = parse_data_columnar(
+                shifts_data, None, calendar and calendar['timezone'])
+            record['rows'] = len(shift_report)
+        with stage('separate_hours', rows=len(shift_report)):
+            shift_report = add_shift_hours(shift_report, calendar)
+        # Partials are keyed on the date the shift is stored under, a start
+        # converted to the calendar timezone can fall on a neighbouring day
+        shift_dates = {
+            int(shift['id']): _shift_date(shift)
+            for shift in shifts_data['data']
+        }
+        shift_report['Date'] = shift_report['Shift_id'].map(shift_dates)
+        partials = shift_report.groupby(['Date', 'Name', 'Pos_id'],
+                                        observed=True).agg(
+                                            shifts=('Position', 'count'),
+                                            employee_hours=('Employee_hours',
+                                                            'sum'),
+                                            weekday_hours=('Weekday_hours',
+                                                           'sum'),
+                                            weekend_hours=('Weekend_hours',
+                                                           'sum'),
+                                            overtime=('Overtime', 'sum'))
+        with connection:
+            connection.execute(
+                'DELETE FROM standby_partials WHERE date BETWEEN ? AND ?',
+                (range_start.isoformat(), range_end.isoformat()))
+            connection.executemany(
+                'INSERT INTO standby_partials VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ((date, name, str(pos_id), int(shifts), *hours)
+                 for (date, name, pos_id), shifts, *hours in
+                 partials.itertuples(name=None)))
+            computed_at = time.time()
+            connection.executemany(
+                'INSERT OR REPLACE INTO partial_days (date, computed_at) '
+                'VALUES (?, ?)',
+                ((day, computed_at) for day in _days(range_start, range_end)))
+    return changed
+
+
+def load_standby_report(connection: sqlite3.Connection,
+                        start_date: datetime.date, end_date: datetime.date,
+                        select_positions) -> pd.DataFrame:
+    '''Build the standby report of any period by summing the stored daily partials'''
+    schedules = list(select_positions)
+    rows = connection.execute(
+        'SELECT name, SUM(shifts), SUM(employee_hours), SUM(weekday_hours), '
+        'SUM(weekend_hours) FROM standby_partials '
+        'WHERE date BETWEEN ? AND ? AND pos_id IN '
+        f'({", ".join("?" * len(schedules))}) '
+        'GROUP BY name ORDER BY name',
+        (start_date.isoformat(), end_date.isoformat(), *schedules))
+    standby_report = pd.DataFrame(rows.fetchall(),
+                                  columns=[
+                                      'Name', 'Number_of_shifts',
+                                      'Total_hours', 'Total_weekday_hours',
+                                      'Total_weekend_hours'
+                                  ])
+    # Formatting the columns with floating-point numbers to two decimal places
+    for column in [
+            'Total_hours', 'Total_weekday_hours', 'Total_weekend_hours'
+    ]:
+        standby_report[column] = standby_report[column].round(2)
+    return standby_report
+
+
+def get_standby_report_cached(start_date: datetime.date,
+                              end_date: datetime.date,
+                              access_token: str,
+                              db_path: Path,
+                              select_positions,
+                              max_age: datetime.timedelta = datetime.timedelta(
+                                  hours=24),
+                              calendar: dict | None = None,
+                              **fetch_kwargs) -> pd.DataFrame | None:
+    '''Return the standby report of the range from stored daily partials
+
+    Missing or stale days are fetched first, only days whose shifts changed
+    since their partials were computed are reprocessed.
+
+    Args:
+        start_date (datetime.date): Start of the period
+        end_date (datetime.date): End of the period, inclusive
+        access_token (str): Humanity access token
+        db_path (Path): SQLite store file
+        select_positions (tuple): Position ids to include
+        max_age (datetime.timedelta): Freshness window for stored days
+        calendar (dict | None): Compiled calendar rules passed to add_shift_hours
+        **fetch_kwargs: Extra arguments for get_shifts (e.g. window_days)
+
+    Returns:
+        pd.DataFrame | None: Standby report, None if a fetch failed
+    '''
+    connection = connect(db_path)
+    try:
+        with stage('get_shifts'):
+            fetched = refresh_shifts(connection, start_date, end_date,
+                                     access_token, max_age,
+                                     dict.fromkeys(select_positions),
+                                     **fetch_kwargs)
+        if not fetched:
+            return None
+        update_standby_partials(connection, start_date, end_date, calendar)
+        with stage('aggregation') as record:
+            standby_report = load_standby_report(connection, start_date,
+                                                 end_date, select_positions)
+            record['rows'] = len(standby_report)
+        return standby_report
+    finally:
+        connection.close()
@@ -0,0 +1,241 @@
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import re
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import main
+from instrumentation import configure as configure_instrumentation
+from instrumentation import stage
+from report_writer import FORMATS, check_format, report_path, write_report
+
+script_path = Path(__file__).resolve()
+script_parent = script_path.parent
+
+# Constants and configurations
+TENANTS_FILE = script_parent / 'files' / 'tenants.json'
+TENANT_OUTPUT_DIR = script_parent / 'output' / 'tenants'
+TENANT_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def load_tenants(filename):
+    '''Read tenant configs, a JSON list of objects with name, credentials_file
+    and optional positions ({position id: name}, defaults to DEFAULT_POSITIONS)
+
+    Relative credentials files are resolved against the script directory.
+    '''
+    with open(filename) as json_file:
+        tenants = json.load(json_file)
+    names = set()
+    for tenant in tenants:
+        name = tenant.get('name', '')
+        if not TENANT_NAME.match(name) or name in names:
+            raise ValueError(f'Tenant names must be unique and use only '
+                             f'letters, digits, _ and -: {name!r}')
+        if 'credentials_file' not in tenant:
+            raise ValueError(f'Tenant {name} has no credentials_file')
+        names.add(name)
+        tenant['credentials_file'] = script_parent / tenant['credentials_file']
+        tenant['positions'] = {
+            str(position_id): position_name for position_id, position_name in
+            tenant.get('positions', main.DEFAULT_POSITIONS).items()
+        }
+    return tenants
+
+
+def build_standby_report(shifts_data, select_positions, calendar):
+    '''Run the hour split and aggregation, called in a worker process'''
+    from report_generator import generate_shift_report, generate_standby_report
+
+    shift_report = generate_shift_report(shifts_data,
+                                         select_positions,
+                                         calendar,
+                                         verbose=False)
+    return generate_standby_report(shift_report, select_positions)
+
+
+def run_tenant(tenant, args, calendar, process_pool):
+    '''Fetch, process and write the report of one tenant
+
+    Returns:
+        dict: name, status, rows, path and error of the tenant, never raises
+    '''
+    from api_handler import get_access_token, get_shifts
+    from shift_store import get_shifts_cached
+
+    name = tenant['name']
+    select_positions = list(tenant['positions'])
+    schedule_filter = dict.fromkeys(select_positions)
+    result = {'name': name, 'status': 'error', 'report': None}
+    try:
+        with stage('tenant_fetch') as record:
+            record['tenant'] = name
+            access_token = get_access_token(tenant['credentials_file'])
+            if not access_token:
+                raise Exception('Authentication failed')
+            if args.no_store:
+                shifts_data = get_shifts(args.report_start_date,
+                                         args.report_end_date,
+                                         access_token,
+                                         schedule_filter,
+                                         window_days=args.window_days)
+            else:
+                # One store per tenant, shift ids and fetch scopes are per account
+                shifts_data = get_shifts_cached(
+                    args.report_start_date,
+                    args.report_end_date,
+                    access_token,
+                    script_parent / 'files' / f'shifts_{name}.sqlite3',
+                    max_age=datetime.timedelta(hours=args.max_age_hours),
+                    positions=schedule_filter,
+                    window_days=args.window_days)
+            if not shifts_data or not shifts_data['data']:
+                raise Exception('Shift data is empty')
+            record['rows'] = len(shifts_data['data'])
+
+        # The hour math runs in a worker process, the thread only waits
+        with stage('tenant_report') as record:
+            record['tenant'] = name
+            report = process_pool.submit(build_standby_report, shifts_data,
+                                         select_positions, calendar).result()
+            record['rows'] = len(report)
+
+        timeline = main.get_timeline(args.report_start_date,
+                                     args.report_end_date)
+        path = report_path(TENANT_OUTPUT_DIR / f'report_{name}_{timeline}',
+                           args.output_format)
+        comment = (f'This report includes positions: '
+                   f'{"; ".join(tenant["positions"].values())} of {name} '
+                   f'for the time period of {timeline.replace("_", " to ")}')
+        write_report(path, comment, report, args.output_format)
+        result.update(status='ok', report=report, rows=len(report), path=path)
+        logging.info(f'Tenant {name}: {len(report)} rows written to {path}')
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        logging.error(f'Tenant {name} failed: {traceback.format_exc()}')
+    return result
+
+
+def run_tenants(tenants, args, calendar=None):
+    '''Report every tenant concurrently and write the combined report
+
+    Returns:
+        list[dict]: Per tenant results in config order
+    '''
+    import pandas as pd
+
+    TENANT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    processes = args.processes or min(len(tenants), os.cpu_count() or 1)
+    # Spawned workers do not inherit the locks held by fetching threads
+    with ProcessPoolExecutor(processes,
+                             multiprocessing.get_context('spawn')) as process_pool, \
+            ThreadPoolExecutor(args.max_workers) as thread_pool:
+        results = list(
+            thread_pool.map(
+                lambda tenant: run_tenant(tenant, args, calendar,
+                                          process_pool), tenants))
+
+    succeeded = [result for result in results if result['status'] == 'ok']
+    failed = [result['name'] for result in results if result['status'] != 'ok']
+    if succeeded:
+        combined = pd.concat([
+            result['report'].assign(Tenant=result['name'])
+            for result in succeeded
+        ], ignore_index=True)
+        combined = combined[['Tenant'] +
+                            [column for column in combined if column != 'Tenant']]
+        timeline = main.get_timeline(args.report_start_date,
+                                     args.report_end_date)
+        comment = (f'This report includes tenants: '
+                   f'{"; ".join(result["name"] for result in succeeded)} '
+                   f'for the time period of {timeline.replace("_", " to ")}')
+        if failed:
+            comment += f', failed tenants: {"; ".join(failed)}'
+        path = report_path(script_parent / 'output' / f'report_tenants_{timeline}',
+                           args.output_format)
+        with stage('csv_write', rows=len(combined)):
+            write_report(path, comment, combined, args.output_format)
+        print(comment, '\n', combined)
+    for result in results:
+        result.pop('report')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Generate standby reports of several Humanity accounts concurrently')
+    parser.add_argument('--tenants_file',
+                        type=Path,
+                        default=TENANTS_FILE,
+                        help='JSON list of tenants with name, credentials_file and positions')
+    parser.add_argument('--report_start_date',
+                        type=main.get_date,
+                        default=main.last_month_first_day(),
+                        help='Start date of the report in mm.dd.yyyy format')
+    parser.add_argument('--report_end_date',
+                        type=main.get_date,
+                        default=main.last_month_last_day(),
+                        help='End date of the report in mm.dd.yyyy format')
+    parser.add_argument('--output_format',
+                        choices=FORMATS,
+                        default='csv',
+                        help='File format of the reports')
+    parser.add_argument('--max_workers',
+                        type=int,
+                        default=4,
+                        help='Tenants fetched at the same time')
+    parser.add_argument('--processes',
+                        type=int,
+                        default=None,
+                        help='Worker processes for the hour split, defaults to one per tenant up to the CPU count')
+    parser.add_argument('--max_age_hours',
+                        type=float,
+                        default=24,
+                        help='Stored shifts fetched longer ago are fetched again')
+    parser.add_argument('--window_days',
+                        type=int,
+                        default=None,
+                        help='Fetch the period in windows of this many days')
+    parser.add_argument('--no_store',
+                        action='store_true',
+                        default=False,
+                        help='Always fetch the whole period from the API')
+    parser.add_argument('--calendar_rules',
+                        type=Path,
+                        default=None,
+                        help='JSON file with business hours, holidays and break rules')
+    args = parser.parse_args()
+    if args.report_end_date < args.report_start_date:
+        parser.error('report_end_date must not be before report_start_date')
+    calendar = None
+    try:
+        check_format(args.output_format)
+        tenants = load_tenants(args.tenants_file)
+        if args.calendar_rules:
+            from calendar_rules import compile_rules, load_rules
+            calendar = compile_rules(load_rules(args.calendar_rules))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    logging.basicConfig(filename=main.LOG_FILE,
+                        level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        encoding='utf-8')
+    logging.info(f'Tenant run started for {len(tenants)} tenants')
+    configure_instrumentation(main.METRICS_FILE)
+
+    from token_cache import configure as configure_token_cache
+    configure_token_cache(main.TOKEN_CACHE_FILE)
+
+    results = run_tenants(tenants, args, calendar)
+    for result in results:
+        print(f'{result["name"]}: {result["status"]} '
+              f'{result.get("path") or result.get("error")}')
+    failed = [result['name'] for result in results if result['status'] != 'ok']
+    if failed:
+        raise SystemExit(f'Failed tenants: {", ".join(failed)}')
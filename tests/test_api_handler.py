@@ -0,0 +1,171 @@
+import datetime
+import json
+
+import pytest
+
+import api_handler
+from api_handler import _date_windows, _iter_json_array, _merge_shift_windows
+
+
+def date(day):
+    return datetime.date.fromisoformat(day)
+
+
+# (start, end, window_days, expected windows)
+WINDOWS = {
+    'single day': ('2024-01-03', '2024-01-03', 7, [('2024-01-03', '2024-01-03')]),
+    'shorter than a window': ('2024-01-01', '2024-01-05', 7, [('2024-01-01', '2024-01-05')]),
+    'exactly one window': ('2024-01-01', '2024-01-07', 7, [('2024-01-01', '2024-01-07')]),
+    'one day over a window': ('2024-01-01', '2024-01-08', 7,
+                              [('2024-01-01', '2024-01-07'), ('2024-01-08', '2024-01-08')]),
+    'exact multiple': ('2024-01-01', '2024-01-14', 7,
+                       [('2024-01-01', '2024-01-07'), ('2024-01-08', '2024-01-14')]),
+    'over a leap day': ('2024-02-26', '2024-03-06', 5,
+                        [('2024-02-26', '2024-03-01'), ('2024-03-02', '2024-03-06')]),
+    'over a year end': ('2023-12-30', '2024-01-02', 2,
+                        [('2023-12-30', '2023-12-31'), ('2024-01-01', '2024-01-02')]),
+    'one day windows': ('2024-01-01', '2024-01-03', 1,
+                        [('2024-01-01', '2024-01-01'), ('2024-01-02', '2024-01-02'),
+                         ('2024-01-03', '2024-01-03')]),
+}
+
+
+@pytest.mark.parametrize('start, end, window_days, expected',
+                         WINDOWS.values(),
+                         ids=WINDOWS.keys())
+def test_date_windows(start, end, window_days, expected):
+    assert _date_windows(date(start), date(end), window_days) == [
+        (date(window_start), date(window_end))
+        for window_start, window_end in expected
+    ]
+
+
+@pytest.mark.parametrize('days', range(1, 40))
+@pytest.mark.parametrize('window_days', [1, 3, 7, 31])
+def test_date_windows_cover_the_range(days, window_days):
+    start = date('2024-02-20')
+    end = start + datetime.timedelta(days=days - 1)
+    windows = _date_windows(start, end, window_days)
+
+    # Inclusive windows, back to back without gaps or overlaps
+    assert windows[0][0] == start
+    assert windows[-1][1] == end
+    for (_, previous_end), (window_start, _) in zip(windows, windows[1:]):
+        assert window_start == previous_end + datetime.timedelta(days=1)
+    for window_start, window_end in windows:
+        assert 1 <= (window_end - window_start).days + 1 <= window_days
+
+
+def test_date_windows_empty_range():
+    assert _date_windows(date('2024-01-02'), date('2024-01-01'), 7) == []
+
+
+def test_merge_shift_windows():
+    overnight = {'id': '2', 'start_date': '2024-01-07', 'end_date': '2024-01-08'}
+    responses = [{
+        'status': 1,
+        'data': [{'id': '1'}, overnight]
+    }, {
+        'status': 1,
+        'data': [dict(overnight, title='second copy'), {'id': '3'}]
+    }, {
+        'status': 1,
+        'data': None
+    }]
+
+    merged = _merge_shift_windows(responses)
+
+    # The shift spanning both windows is kept once, first copy, in order
+    assert merged == {'status': 1, 'data': [{'id': '1'}, overnight, {'id': '3'}]}
+    assert responses[0]['data'] == [{'id': '1'}, overnight]
+
+
+def test_get_shifts_windows(monkeypatch):
+    requested = []
+
+    def fetch_window(url, headers, params, retries):
+        requested.append((params['start_date'], params['end_date']))
+        # Overnight shift 2 is returned by both windows it touches
+        shifts = {
+            '2024-01-01': [{'id': '1'}, {'id': '2'}],
+            '2024-01-08': [{'id': '2'}, {'id': '3'}],
+            '2024-01-15': [{'id': '4'}],
+        }[params['start_date']]
+        return {'status': 1, 'data': shifts}
+
+    monkeypatch.setattr(api_handler, '_fetch_shifts_window', fetch_window)
+    shifts = api_handler.get_shifts(date('2024-01-01'),
+                                    date('2024-01-16'),
+                                    'token',
+                                    window_days=7)
+
+    assert sorted(requested) == [('2024-01-01', '2024-01-07'),
+                                 ('2024-01-08', '2024-01-14'),
+                                 ('2024-01-15', '2024-01-16')]
+    assert [shift['id'] for shift in shifts['data']] == ['1', '2', '3', '4']
+
+
+def test_get_shifts_failed_window(monkeypatch):
+    def fetch_window(url, headers, params, retries):
+        if params['start_date'] == '2024-01-08':
+            return None
+        return {'status': 1, 'data': [{'id': params['start_date']}]}
+
+    monkeypatch.setattr(api_handler, '_fetch_shifts_window', fetch_window)
+    # A partial period is not returned as if it were complete
+    assert api_handler.get_shifts(date('2024-01-01'),
+                                  date('2024-01-16'),
+                                  'token',
+                                  window_days=7) is None
+
+
+SHIFTS = [{
+    'id': '1',
+    'title': 'Quoted "night" shift, ends ] at }',
+    'notes': 'Back\\slash \\" and escaped é ☃'
+}, {
+    'id': '2',
+    'title': 'Multibyte Zürich 東京 🚑',
+    'schedule_name': '[{"data": []}]'
+}, {
+    'id': '3',
+    'title': '',
+    'paid_time': 8.5
+}]
+
+
+def shifts_body(ensure_ascii):
+    body = {'status': 1, 'data': SHIFTS, 'token': 'x'}
+    return json.dumps(body, ensure_ascii=ensure_ascii,
+                      indent=1).encode('utf-8')
+
+
+@pytest.mark.parametrize('ensure_ascii', [True, False],
+                         ids=['escaped', 'utf-8'])
+def test_iter_json_array_every_split(ensure_ascii):
+    body = shifts_body(ensure_ascii)
+    # Every byte offset, including inside strings, escapes and multibyte characters
+    for split in range(len(body) + 1):
+        chunks = [body[:split], body[split:]]
+        assert list(_iter_json_array(chunks)) == SHIFTS, split
+
+
+def test_iter_json_array_byte_at_a_time():
+    body = shifts_body(ensure_ascii=False)
+    chunks = [body[index:index + 1] for index in range(len(body))]
+    assert list(_iter_json_array(chunks)) == SHIFTS
+
+
+def test_iter_json_array_yields_before_the_body_ends():
+    body = shifts_body(ensure_ascii=False)
+    second = body.index(b'"id": "2"')
+    items = _iter_json_array(iter([body[:second], body[second:]]))
+    # The first shift is complete in the first chunk
+    assert next(items) == SHIFTS[0]
+    assert list(items) == SHIFTS[1:]
+
+
+def test_iter_json_array_truncated():
+    body = shifts_body(ensure_ascii=False)
+    with pytest.raises(ValueError):
+        list(_iter_json_array([body[:body.index(b'"id": "3"')]]))
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from calendar_rules import DEFAULT_RULES, compile_rules
+
+
+def rules_with_positions(positions):
+    return {**DEFAULT_RULES, 'positions': positions}
+
+
+def test_position_business_hours():
+    calendar = compile_rules(
+        rules_with_positions({3115142: {'business_hours': ['08:00', '20:00']}}))
+    assert calendar['position_hours'] == {
+        '3115142': (np.timedelta64(480, 'm'), np.timedelta64(1200, 'm'))
+    }
+
+
+def test_position_without_business_hours_uses_defaults():
+    calendar = compile_rules(rules_with_positions({'3115142': {}}))
+    assert calendar['position_hours'] == {}
+
+
+@pytest.mark.parametrize('position_rules', [['08:00', '20:00'], '08:00-20:00'],
+                         ids=['list', 'string'])
+def test_position_rules_must_be_objects(position_rules):
+    with pytest.raises(ValueError, match='3115142'):
+        compile_rules(rules_with_positions({'3115142': position_rules}))
+
+
+def test_unknown_position_rules_are_rejected():
+    with pytest.raises(ValueError, match='3115142.*business_hour'):
+        compile_rules(
+            rules_with_positions(
+                {'3115142': {
+                    'business_hour': ['08:00', '20:00']
+                }}))
@@ -0,0 +1,65 @@
+import datetime
+import json
+import os
+import time
+
+from catalog import Catalog
+
+TTL = datetime.timedelta(hours=1)
+
+
+class Fetch:
+    '''Catalog fetch returning the given entries after a delay, counts its calls'''
+
+    def __init__(self, entries, seconds=0.0):
+        self.entries = entries
+        self.seconds = seconds
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.seconds)
+        return {str(index): entry for index, entry in enumerate(self.entries)}
+
+
+def write_stale(path, entries):
+    path.write_text(
+        json.dumps({str(index): entry for index, entry in enumerate(entries)}))
+    old = time.time() - 2 * TTL.total_seconds()
+    os.utime(path, (old, old))
+
+
+def test_unknown_id_waits_for_background_refresh(tmp_path):
+    path = tmp_path / 'positions.json'
+    write_stale(path, [{'id': '1', 'name': 'Old'}])
+    fetch = Fetch([{'id': '1', 'name': 'Old'}, {'id': '2', 'name': 'New'}],
+                  seconds=0.2)
+    catalog = Catalog(path, fetch, TTL)
+
+    # The stale file starts a background refresh, the new id arrives with it
+    assert catalog.data()['0']['name'] == 'Old'
+    assert catalog.get('2') == {'id': '2', 'name': 'New'}
+    assert [entry['id'] for entry in catalog.ordered(['2', '1'])] == ['1', '2']
+    assert fetch.calls == 1
+
+
+def test_unknown_id_refreshes_once(tmp_path):
+    path = tmp_path / 'positions.json'
+    fetch = Fetch([{'id': '1', 'name': 'One'}])
+    catalog = Catalog(path, fetch, TTL)
+
+    assert catalog.get('1') == {'id': '1', 'name': 'One'}
+    assert catalog.get('3') is None
+    assert catalog.get('4') is None
+    assert fetch.calls == 1
+
+
+def test_unreadable_cache_is_fetched_again(tmp_path):
+    path = tmp_path / 'positions.json'
+    path.write_text('{"0": {"id": "1", "na')
+    fetch = Fetch([{'id': '1', 'name': 'One'}])
+    catalog = Catalog(path, fetch, TTL)
+
+    assert catalog.get('1') == {'id': '1', 'name': 'One'}
+    assert json.loads(path.read_text()) == {'0': {'id': '1', 'name': 'One'}}
+    assert list(tmp_path.glob('*.tmp')) == []
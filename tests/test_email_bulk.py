@@ -0,0 +1,140 @@
+import email
+import socket
+import threading
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+import email_handler
+
+REJECTED = 'rejected@example.com'
+
+
+class SMTPStub:
+    '''Accepts every message except for REJECTED, drops the connection on the given MAIL commands'''
+
+    def __init__(self, drop_on_mail=()):
+        self.lock = threading.Lock()
+        self.drop_on_mail = set(drop_on_mail)
+        self.mail_commands = 0
+        self.drops = 0
+        self.messages = []
+
+    async def handle_MAIL(self, server, session, envelope, address,
+                          mail_options):
+        with self.lock:
+            self.mail_commands += 1
+            drop = self.mail_commands in self.drop_on_mail
+            if drop:
+                self.drops += 1
+        if drop:
+            # Closed without a reply, the client sees the connection drop
+            server.transport.close()
+            return '421 Closing'
+        envelope.mail_from = address
+        return '250 OK'
+
+    async def handle_RCPT(self, server, session, envelope, address,
+                          rcpt_options):
+        if address == REJECTED:
+            return '550 5.1.1 User unknown'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        message = email.message_from_bytes(envelope.content)
+        with self.lock:
+            self.messages.append((session.peer, message['Subject'],
+                                  tuple(envelope.rcpt_tos)))
+        return '250 OK'
+
+
+@pytest.fixture
+def smtp():
+    stubs = []
+
+    def start(**kwargs):
+        stub = SMTPStub(**kwargs)
+        # The controller connects to its own port on start, so it needs a fixed one
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            stub.port = probe.getsockname()[1]
+        controller = aiosmtpd_controller.Controller(stub,
+                                                    hostname='127.0.0.1',
+                                                    port=stub.port)
+        controller.start()
+        stubs.append(controller)
+        return stub
+
+    yield start
+    for controller in stubs:
+        controller.stop()
+
+
+def emails(count, to_emails=lambda index: [f'user{index}@example.com']):
+    return [{
+        'subject': f'Timesheet {index}',
+        'message': 'Attached',
+        'from_email': 'reports@example.com',
+        'to_emails': to_emails(index)
+    } for index in range(count)]
+
+
+def send_bulk(stub, batch, **kwargs):
+    return email_handler.send_bulk(batch,
+                                   '127.0.0.1',
+                                   stub.port,
+                                   'reports@example.com',
+                                   '',
+                                   use_tls=False,
+                                   **kwargs)
+
+
+def test_every_message_is_delivered_once(smtp):
+    stub = smtp()
+    results = send_bulk(stub, emails(25), pool_size=3,
+                        messages_per_connection=4)
+
+    assert [result['sent'] for result in results] == [True] * 25
+    assert [result['to_emails'] for result in results
+            ] == [[f'user{index}@example.com'] for index in range(25)]
+    subjects = sorted(message[1] for message in stub.messages)
+    assert subjects == sorted(f'Timesheet {index}' for index in range(25))
+    # Connections are reused, at most messages_per_connection messages each
+    peers = [message[0] for message in stub.messages]
+    assert max(map(peers.count, set(peers))) == 4
+
+
+def test_dropped_connection_is_reopened(smtp):
+    stub = smtp(drop_on_mail={3})
+    results = send_bulk(stub, emails(10), pool_size=1)
+
+    assert stub.drops == 1
+    assert [result['sent'] for result in results] == [True] * 10
+    # The message whose connection dropped is sent once on a new connection
+    subjects = [message[1] for message in stub.messages]
+    assert sorted(subjects) == sorted(f'Timesheet {index}'
+                                      for index in range(10))
+    assert len({message[0] for message in stub.messages}) == 2
+
+
+def test_rejected_recipient_fails_only_its_email(smtp):
+    stub = smtp()
+    recipients = {3: [REJECTED], 6: ['user6@example.com', REJECTED]}
+    results = send_bulk(
+        stub,
+        emails(10,
+               lambda index: recipients.get(index,
+                                            [f'user{index}@example.com'])),
+        pool_size=2)
+
+    failed = {index for index, result in enumerate(results)
+              if not result['sent']}
+    assert failed == {3, 6}
+    assert REJECTED in results[3]['error']
+    assert REJECTED in results[6]['error']
+    delivered = sorted(message[1] for message in stub.messages)
+    assert delivered == sorted(f'Timesheet {index}' for index in range(10)
+                               if index != 3)
+    assert ('user6@example.com', ) in [message[2] for message in stub.messages]
@@ -0,0 +1,71 @@
+import json
+
+import pandas as pd
+import pytest
+
+import report_generator
+from benchmarks.synthetic import generate_shifts_payload
+from calendar_rules import compile_rules, load_rules
+
+pytest.importorskip('polars')
+
+SELECT_POSITIONS = ['3115142', '3115140', '3115141', '3110230']
+RULES = {
+    'timezone': 'Europe/Berlin',
+    'holidays': ['2024-01-01', '2024-12-25'],
+    'weekend_days': [4, 5, 6],
+    'positions': {'3115142': {'business_hours': ['08:00', '20:00']}},
+    'breaks': [{'titles': ['Night'], 'hours': 0.5},
+               {'pos_ids': ['3110228'], 'hours': 1.0}]
+}
+
+
+def _with_time_suffix(payload: dict, suffix) -> dict:
+    '''Append a per shift suffix such as fractional seconds or an offset to both timestamps'''
+    for index, shift in enumerate(payload['data']):
+        shift['start_timestamp'] += suffix(index)
+        shift['end_timestamp'] += suffix(index)
+    return payload
+
+
+@pytest.fixture(scope='module')
+def calendar(tmp_path_factory):
+    rules_file = tmp_path_factory.mktemp('rules') / 'rules.json'
+    rules_file.write_text(json.dumps(RULES))
+    calendar = compile_rules(load_rules(rules_file))
+    # Per position hours are the part of the calendar split most likely to differ
+    assert calendar['position_hours']
+    return calendar
+
+
+def payloads():
+    yield 'plain', generate_shifts_payload(3000, employees_per_shift=2)
+    yield 'sub-second', _with_time_suffix(
+        generate_shifts_payload(3000, employees_per_shift=2, seed=1),
+        lambda index: f'.{index * 7919 % 1000:03d}')
+    yield 'offset', _with_time_suffix(
+        generate_shifts_payload(3000, employees_per_shift=2, seed=2),
+        lambda index: f'.{index % 1000:03d}+05:30')
+
+
+@pytest.mark.parametrize('with_calendar', [False, True],
+                         ids=['default rules', 'calendar rules'])
+@pytest.mark.parametrize(
+    'payload', [pytest.param(payload, id=name) for name, payload in payloads()])
+def test_polars_matches_pandas(payload, with_calendar, calendar):
+    calendar = calendar if with_calendar else None
+    reports = {}
+    for engine in report_generator.ENGINES:
+        shift_report = report_generator.generate_shift_report(
+            payload, None, calendar, verbose=False, engine=engine)
+        reports[engine] = (report_generator.as_pandas(shift_report),
+                           report_generator.generate_standby_report(
+                               shift_report, SELECT_POSITIONS))
+
+    pandas_shifts, pandas_standby = reports['pandas']
+    polars_shifts, polars_standby = reports['polars']
+    # Same floats, not just close ones
+    pd.testing.assert_frame_equal(polars_shifts, pandas_shifts,
+                                  check_exact=True)
+    pd.testing.assert_frame_equal(polars_standby, pandas_standby,
+                                  check_exact=True)
@@ -0,0 +1,102 @@
+import email.utils
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+
+
+def response_with(retry_after):
+    response = requests.Response()
+    response.headers['Retry-After'] = retry_after
+    return response
+
+
+@pytest.mark.parametrize('retry_after, expected', [
+    ('3', 3.0),
+    ('-1', 0.0),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0),
+    ('not a date', None),
+    ('Wed, 99 Foo 2015 07:28:00 GMT', None),
+])
+def test_retry_after(retry_after, expected):
+    assert http_client._retry_after(response_with(retry_after)) == expected
+
+
+def test_retry_after_date_without_zone_is_gmt():
+    in_a_minute = time.time() + 60
+    value = email.utils.formatdate(in_a_minute, usegmt=True)
+    for retry_after in (value, value.removesuffix(' GMT')):
+        delay = http_client._retry_after(response_with(retry_after))
+        assert 55 <= delay <= 60
+
+
+class FlakyStub(BaseHTTPRequestHandler):
+    '''Answers 503 with the server's Retry-After value until the given attempt, then 200'''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests += 1
+        code = 503 if self.server.requests < self.server.succeed_on else 200
+        body = b'busy' if code == 503 else b'ok'
+        self.send_response(code)
+        if code == 503:
+            self.send_header('Retry-After', self.server.retry_after)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _respond
+
+
+@pytest.fixture
+def flaky():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyStub)
+    server.daemon_threads = True
+    server.requests = 0
+    server.succeed_on = 3
+    server.retry_after = 'Wed, 99 Foo 2015 07:28:00 GMT'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+def test_malformed_retry_after_falls_back_to_backoff(flaky, monkeypatch):
+    server, url = flaky
+    monkeypatch.setitem(http_client.settings, 'backoff_factor', 0.01)
+    response = http_client.get(url)
+    assert (response.status_code, response.text) == (200, 'ok')
+    assert server.requests == 3
+
+
+def test_post_is_not_resent_after_a_read_timeout(monkeypatch):
+    class SlowStub(FlakyStub):
+
+        def _respond(self):
+            self.server.requests += 1
+            time.sleep(0.5)
+
+        do_POST = _respond
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowStub)
+    server.daemon_threads = True
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(http_client.settings, 'backoff_factor', 0.01)
+    try:
+        with pytest.raises(requests.ReadTimeout):
+            http_client.post(f'http://127.0.0.1:{server.server_address[1]}/',
+                             timeout=(1, 0.1))
+        time.sleep(0.5)
+        assert server.requests == 1
+    finally:
+        server.shutdown()
+        server.server_close()
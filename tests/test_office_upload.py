@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import office_handler
+
+CHUNK_ALIGNMENT = 320 * 1024
+
+
+class GraphStub(BaseHTTPRequestHandler):
+    '''Minimal Graph API, records every request in the server's events list'''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, obj=None):
+        body = json.dumps(obj).encode() if obj is not None else b''
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _record(self, *event):
+        with self.server.lock:
+            self.server.events.append(event)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.endswith('/token'):
+            return self._send(200, {'access_token': 'token', 'expires_in': 3600})
+        if self.headers.get('Authorization') != 'Bearer token':
+            return self._send(401, {'error': 'unauthorized'})
+        if self.path.endswith('/sendMail'):
+            message = json.loads(body)['message']
+            self._record('sendMail', message['toRecipients'][0]['emailAddress']
+                         ['address'], len(message.get('attachments', [])))
+            return self._send(202)
+        if self.path.endswith('/messages'):
+            with self.server.lock:
+                message_id = f'm{len(self.server.uploads)}'
+                self.server.uploads[message_id] = bytearray()
+            self._record('draft', message_id)
+            return self._send(201, {'id': message_id})
+        match = re.search(r'/messages/(\w+)/attachments$', self.path)
+        if match:
+            self._record('attachment', match[1], json.loads(body)['name'])
+            return self._send(201, {})
+        match = re.search(r'/messages/(\w+)/attachments/createUploadSession$',
+                          self.path)
+        if match:
+            size = json.loads(body)['AttachmentItem']['size']
+            self._record('createUploadSession', match[1], size)
+            return self._send(201, {
+                'uploadUrl':
+                f'http://{self.headers["Host"]}/upload/{match[1]}'
+            })
+        match = re.search(r'/messages/(\w+)/send$', self.path)
+        if match:
+            self._record('send', match[1])
+            return self._send(202)
+        self._send(404, {'error': self.path})
+
+    def do_PUT(self):
+        message_id = self.path.rsplit('/', 1)[1]
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        first, last, total = map(
+            int,
+            re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)',
+                         self.headers['Content-Range']).groups())
+        self._record('upload', message_id, first, last, total, len(data),
+                     'Authorization' in self.headers)
+        upload = self.server.uploads[message_id]
+        upload += data
+        if len(upload) == total:
+            return self._send(201, {})
+        self._send(200, {'nextExpectedRanges': [f'{len(upload)}-']})
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GraphStub)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.events = []
+    server.uploads = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    monkeypatch.setattr(office_handler, 'LOGIN_BASE_URL', base_url)
+    monkeypatch.setattr(office_handler, 'GRAPH_BASE_URL', base_url + '/v1.0')
+    monkeypatch.setattr(office_handler, 'get_office_credentials',
+                        lambda filename: ('tenant', 'client', 'secret'))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def large_attachment(tmp_path):
+    # Three chunks, the last one shorter than the others
+    path = tmp_path / 'large.csv'
+    path.write_bytes(os.urandom(2 * office_handler.UPLOAD_CHUNK_SIZE + 12345))
+    return path
+
+
+def assert_uploaded_in_order(events, message_id, attachment):
+    size = attachment.stat().st_size
+    message_events = [event for event in events if event[1] == message_id]
+    assert message_events[0] == ('draft', message_id)
+    assert message_events[1] == ('createUploadSession', message_id, size)
+    assert message_events[-1] == ('send', message_id)
+
+    offset = 0
+    uploads = message_events[2:-1]
+    for kind, _, first, last, total, length, authorized in uploads:
+        assert kind == 'upload'
+        assert (first, last, total) == (offset, offset + length - 1, size)
+        # The upload URL is pre-authenticated
+        assert not authorized
+        if last + 1 < size:
+            assert length % CHUNK_ALIGNMENT == 0
+        offset += length
+    assert offset == size
+    assert len(uploads) == 3
+
+
+def test_send_with_upload_session(graph, large_attachment):
+    assert office_handler.send_email('sender@example.com',
+                                     ['recipient@example.com'], 'Subject',
+                                     'Body', large_attachment) is True
+    assert_uploaded_in_order(graph.events, 'm0', large_attachment)
+    assert graph.uploads['m0'] == large_attachment.read_bytes()
+
+
+def test_send_emails(graph, large_attachment, tmp_path):
+    small_attachment = tmp_path / 'small.csv'
+    small_attachment.write_text('a,b\n1,2\n')
+    emails = [{
+        'sender_email': 'sender@example.com',
+        'recipient_emails': [f'recipient{index}@example.com'],
+        'subject': 'Subject',
+        'body': 'Body',
+        'attachment_path': attachment
+    } for index, attachment in enumerate(
+        [small_attachment, large_attachment] * 3)]
+
+    assert office_handler.send_emails(emails, max_workers=4) == [True] * 6
+
+    inline = sorted(event for event in graph.events if event[0] == 'sendMail')
+    assert inline == [('sendMail', f'recipient{index}@example.com', 1)
+                      for index in (0, 2, 4)]
+    assert sorted(graph.uploads) == ['m0', 'm1', 'm2']
+    for message_id, upload in graph.uploads.items():
+        assert_uploaded_in_order(graph.events, message_id, large_attachment)
+        assert upload == large_attachment.read_bytes()
+
+
+def test_send_email_with_several_attachments(graph, large_attachment,
+                                             tmp_path):
+    small_attachment = tmp_path / 'small.csv'
+    small_attachment.write_text('a,b\n1,2\n')
+    other_attachment = tmp_path / 'other.csv'
+    other_attachment.write_text('c,d\n3,4\n')
+
+    # Small attachments together stay inline on a single sendMail
+    assert office_handler.send_email('sender@example.com',
+                                     ['recipient@example.com'], 'Subject',
+                                     'Body',
+                                     [small_attachment, other_attachment])
+    assert graph.events == [('sendMail', 'recipient@example.com', 2)]
+
+    # A large attachment moves the whole message to a draft, both files on it
+    graph.events.clear()
+    assert office_handler.send_email('sender@example.com',
+                                     ['recipient@example.com'], 'Subject',
+                                     'Body',
+                                     [small_attachment, large_attachment])
+    size = large_attachment.stat().st_size
+    assert graph.events[:3] == [('draft', 'm0'),
+                                ('attachment', 'm0', 'small.csv'),
+                                ('createUploadSession', 'm0', size)]
+    assert graph.events[-1] == ('send', 'm0')
+    assert [event[0] for event in graph.events[3:-1]] == ['upload'] * 3
+    assert graph.uploads['m0'] == large_attachment.read_bytes()
+
+
+def test_send_emails_unreadable_attachment(graph, tmp_path):
+    small_attachment = tmp_path / 'small.csv'
+    small_attachment.write_text('a,b\n1,2\n')
+    emails = [{
+        'sender_email': 'sender@example.com',
+        'recipient_emails': [f'recipient{index}@example.com'],
+        'subject': 'Subject',
+        'body': 'Body',
+        'attachment_path': attachment,
+        'compress': True
+    } for index, attachment in enumerate(
+        [small_attachment, tmp_path / 'missing.csv', small_attachment])]
+
+    # Only the email with the missing attachment fails, the batch completes
+    assert office_handler.send_emails(emails) == [True, None, True]
+    assert sorted(event[1] for event in graph.events) == [
+        'recipient0@example.com', 'recipient2@example.com'
+    ]
@@ -0,0 +1,169 @@
+import datetime
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import api_handler
+import report_service
+from benchmarks.synthetic import generate_shifts_payload
+
+PAYLOAD = generate_shifts_payload(500, start_date=datetime.date(2024, 1, 1),
+                                  days=31)
+QUERY = '/standby?start=2024-01-01&end=2024-01-31'
+
+
+class HumanityStub(BaseHTTPRequestHandler):
+    '''Token and shifts endpoints of Humanity, counts the shifts requests'''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._send(200, {'access_token': 'token', 'expires_in': 3600})
+
+    def do_GET(self):
+        params = {key: values[-1]
+                  for key, values in parse_qs(urlparse(self.path).query).items()}
+        with self.server.lock:
+            self.server.shift_requests += 1
+        schedules = params['schedule'].split(', ')
+        self._send(200, {
+            'status': 1,
+            'data': [
+                shift for shift in PAYLOAD['data']
+                if params['start_date'] <= shift['start_timestamp'][:10] <=
+                params['end_date'] and shift['schedule'] in schedules
+            ]
+        })
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+@pytest.fixture
+def humanity(monkeypatch):
+    server, base_url = serve(HumanityStub)
+    server.lock = threading.Lock()
+    server.shift_requests = 0
+    monkeypatch.setattr(api_handler, 'AUTH_URL', base_url + '/oauth2/token.php')
+    monkeypatch.setattr(api_handler, 'API_BASE_URL', base_url + '/api/v2')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_service(humanity, tmp_path):
+    servers = []
+
+    def make_service(cache_entries=64, compute_seconds=0.0):
+        credentials_file = tmp_path / 'credentials.json'
+        credentials_file.write_text(json.dumps({'client_id': 'test'}))
+        service = report_service.ReportService(credentials_file,
+                                               tmp_path / 'shifts.sqlite3',
+                                               datetime.timedelta(hours=1),
+                                               cache_entries)
+        service.computations = 0
+        compute = service._compute
+
+        def counted_compute(*args):
+            service.computations += 1
+            time.sleep(compute_seconds)
+            return compute(*args)
+
+        service._compute = counted_compute
+        server, base_url = serve(report_service.make_handler(service))
+        servers.append(server)
+        service.base_url = base_url
+        return service
+
+    yield make_service
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(service, path, headers={}):
+    request = urllib.request.Request(service.base_url + path, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, error.read()
+
+
+def test_matching_etag_is_not_modified_without_computing(make_service):
+    # Without cached reports every 200 computes, a 304 must not
+    service = make_service(cache_entries=0)
+    status, headers, body = get(service, QUERY)
+    assert status == 200 and body.startswith(b'Name,')
+    assert service.computations == 1
+
+    status, _, body = get(service, QUERY,
+                          {'If-None-Match': headers['ETag']})
+    assert (status, body) == (304, b'')
+    assert service.computations == 1
+    assert service.status()['not_modified'] == 1
+
+    # The format is part of the ETag
+    status, _, _ = get(service, QUERY + '&format=json',
+                       {'If-None-Match': headers['ETag']})
+    assert status == 200
+    assert service.computations == 2
+
+
+def test_repeated_query_is_a_cache_hit(make_service, humanity):
+    service = make_service()
+    first = get(service, QUERY)
+    shift_requests = humanity.shift_requests
+    second = get(service, QUERY)
+
+    assert first[0] == second[0] == 200
+    assert first[2] == second[2]
+    assert first[1]['ETag'] == second[1]['ETag']
+    assert service.computations == 1
+    assert humanity.shift_requests == shift_requests == 1
+    assert service.status()['hits'] == 1
+
+
+def test_concurrent_requests_share_one_computation(make_service, humanity):
+    service = make_service(compute_seconds=0.3)
+    responses = [None] * 8
+
+    def request(index):
+        responses[index] = get(service, QUERY)
+
+    threads = [
+        threading.Thread(target=request, args=(index, ))
+        for index in range(len(responses))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {response[0] for response in responses} == {200}
+    assert len({response[2] for response in responses}) == 1
+    assert service.computations == 1
+    assert humanity.shift_requests == 1
+    assert service.status()['shared'] > 0
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from report_generator import separate_hours, separate_hours_vectorized
+
+# (start, end) pairs, 2024-01-05 is a Friday
+CASES = {
+    'weekday inside business hours': ('2024-01-03T10:00:00', '2024-01-03T17:00:00'),
+    'weekday around business hours': ('2024-01-03T07:30:00', '2024-01-03T19:15:00'),
+    'weekday before business hours': ('2024-01-03T01:00:00', '2024-01-03T08:00:00'),
+    'weekday after business hours': ('2024-01-03T18:00:00', '2024-01-03T23:00:00'),
+    'weekday overnight': ('2024-01-03T20:00:00', '2024-01-04T08:00:00'),
+    'weekend only': ('2024-01-06T08:00:00', '2024-01-07T20:00:00'),
+    'weekday to weekend': ('2024-01-05T16:00:00', '2024-01-06T06:00:00'),
+    'weekend to weekday': ('2024-01-07T20:00:00', '2024-01-08T11:00:00'),
+    'ends at midnight': ('2024-01-05T18:00:00', '2024-01-06T00:00:00'),
+    'sub-second weekday': ('2024-01-03T08:59:59.250', '2024-01-03T18:00:00.750'),
+    'sub-second weekday to weekend': ('2024-01-05T17:30:00.125', '2024-01-06T02:00:00.500'),
+    'sub-second weekend to weekday': ('2024-01-07T23:59:59.999', '2024-01-08T09:30:00.001'),
+    'multi-day weekdays': ('2024-01-01T10:00:00', '2024-01-03T12:00:00'),
+    'multi-day over a weekend': ('2024-01-04T20:00:00', '2024-01-08T10:00:00'),
+    'multi-day weekday to weekend': ('2024-01-03T12:00:00', '2024-01-07T12:00:00'),
+    'with offset': ('2024-01-05T20:00:00+01:00', '2024-01-06T04:00:00+01:00'),
+}
+
+
+def assert_same_hours(starts, ends):
+    expected = separate_hours(pd.Series(starts), pd.Series(ends))
+    actual = separate_hours_vectorized(pd.Series(starts), pd.Series(ends))
+    for name, expected_values, actual_values in zip(
+            ('weekday_hours', 'weekend_hours', 'overtime'), expected, actual):
+        # Both versions must give the same floats, not just close ones
+        np.testing.assert_array_equal(actual_values,
+                                      np.array(expected_values, dtype=float),
+                                      err_msg=name)
+
+
+@pytest.mark.parametrize('start, end', CASES.values(), ids=CASES.keys())
+def test_matches_separate_hours(start, end):
+    assert_same_hours([start], [end])
+
+
+def test_matches_separate_hours_for_all_cases_at_once():
+    # Parsed first, pandas infers a single string format per Series
+    starts, ends = zip(*(map(pd.Timestamp, case) for case in CASES.values()
+                         if '+' not in case[0]))
+    assert_same_hours(list(starts), list(ends))
+
+
+def test_matches_separate_hours_for_random_shifts():
+    rng = np.random.default_rng(7)
+    starts = (np.datetime64('2024-01-01T00:00:00', 'ms') +
+              rng.integers(0, 60 * 86_400_000, 2000).astype('timedelta64[ms]'))
+    ends = starts + rng.integers(1, 4 * 86_400_000,
+                                 2000).astype('timedelta64[ms]')
+    assert_same_hours(pd.Series(starts).astype(str).tolist(),
+                      pd.Series(ends).astype(str).tolist())
+
+
+def test_empty_input():
+    weekday_hours, weekend_hours, overtime = separate_hours_vectorized(
+        pd.Series([], dtype=object), pd.Series([], dtype=object))
+    assert len(weekday_hours) == len(weekend_hours) == len(overtime) == 0
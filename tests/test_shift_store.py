@@ -0,0 +1,197 @@
+import datetime
+import time
+
+import pandas as pd
+import pytest
+
+import shift_store
+from benchmarks.synthetic import POSITIONS, generate_shifts_payload
+from calendar_rules import DEFAULT_RULES, compile_rules
+from report_generator import generate_shift_report, generate_standby_report
+
+START = datetime.date(2024, 1, 1)
+END = datetime.date(2024, 2, 29)
+SELECT_POSITIONS = list(POSITIONS)[:3]
+# (start, end) subsets of the stored period
+RANGES = {
+    'single day': (datetime.date(2024, 1, 10), datetime.date(2024, 1, 10)),
+    'week': (datetime.date(2024, 1, 8), datetime.date(2024, 1, 14)),
+    'over a month end': (datetime.date(2024, 1, 25), datetime.date(2024, 2, 5)),
+    'leap day': (datetime.date(2024, 2, 29), datetime.date(2024, 2, 29)),
+    'whole period': (START, END),
+}
+
+
+def day(shift):
+    return datetime.date.fromisoformat(shift['start_timestamp'][:10])
+
+
+def expected_report(payload, start_date, end_date, select_positions):
+    shifts = [
+        shift for shift in payload['data']
+        if start_date <= day(shift) <= end_date
+    ]
+    shift_report = generate_shift_report({'data': shifts}, verbose=False)
+    return generate_standby_report(shift_report, select_positions)
+
+
+def assert_same_report(actual, expected):
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True),
+                                  expected.reset_index(drop=True),
+                                  check_dtype=False,
+                                  check_categorical=False,
+                                  check_exact=False,
+                                  atol=0.011)
+
+
+def wait_for_clock():
+    # Partials are outdated when computed strictly before the shifts were fetched
+    time.sleep(0.01)
+
+
+@pytest.fixture
+def payload():
+    return generate_shifts_payload(600, start_date=START, days=60)
+
+
+@pytest.fixture
+def connection(tmp_path, payload):
+    connection = shift_store.connect(tmp_path / 'shifts.sqlite3')
+    shift_store.store_shifts(connection, START, END, {}, payload)
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize('start_date, end_date', RANGES.values(),
+                         ids=RANGES.keys())
+def test_subset_ranges(connection, payload, start_date, end_date):
+    assert len(shift_store.update_standby_partials(connection, START,
+                                                   END)) == 60
+    assert_same_report(
+        shift_store.load_standby_report(connection, start_date, end_date,
+                                        SELECT_POSITIONS),
+        expected_report(payload, start_date, end_date, SELECT_POSITIONS))
+
+
+def test_subset_update_leaves_other_days_pending(connection, payload):
+    week_start, week_end = RANGES['week']
+    changed = shift_store.update_standby_partials(connection, week_start,
+                                                  week_end)
+    assert changed == shift_store._days(week_start, week_end)
+    assert shift_store.update_standby_partials(connection, week_start,
+                                               week_end) == []
+
+    # Only the days outside the week are computed for the whole period
+    changed = shift_store.update_standby_partials(connection, START, END)
+    assert len(changed) == 53
+    assert not set(changed) & set(shift_store._days(week_start, week_end))
+    assert_same_report(
+        shift_store.load_standby_report(connection, START, END,
+                                        SELECT_POSITIONS),
+        expected_report(payload, START, END, SELECT_POSITIONS))
+
+
+def test_scope_change(connection, payload):
+    shift_store.update_standby_partials(connection, START, END)
+    position = SELECT_POSITIONS[0]
+    week_start, week_end = RANGES['week']
+    removed = next(shift for shift in payload['data']
+                   if week_start <= day(shift) <= week_end
+                   and shift['schedule'] == position)
+    payload['data'].remove(removed)
+    refetched = day(removed)
+
+    # Refetch one day for a single position, the shift is gone upstream
+    wait_for_clock()
+    shift_store.store_shifts(
+        connection, refetched, refetched, {position: None}, {
+            'data': [
+                shift for shift in payload['data']
+                if day(shift) == refetched and shift['schedule'] == position
+            ]
+        })
+    assert shift_store.update_standby_partials(connection, START,
+                                               END) == [refetched.isoformat()]
+
+    # Other positions of the day are kept from the earlier unfiltered fetch
+    for start_date, end_date in RANGES.values():
+        assert_same_report(
+            shift_store.load_standby_report(connection, start_date, end_date,
+                                            SELECT_POSITIONS),
+            expected_report(payload, start_date, end_date, SELECT_POSITIONS))
+
+    # Days fetched for all schedules are fresh for any filter, not the reverse
+    max_age = datetime.timedelta(hours=1)
+    other = {SELECT_POSITIONS[1]: None}
+    assert shift_store.stale_days(connection, START, END, other,
+                                  max_age) == []
+    connection.execute("DELETE FROM fetched_days WHERE scope = ''")
+    assert shift_store.stale_days(connection, refetched, refetched,
+                                  {position: None}, max_age) == []
+    assert shift_store.stale_days(connection, refetched, refetched, other,
+                                  max_age) == [refetched.isoformat()]
+    assert shift_store.stale_days(connection, refetched, refetched, {},
+                                  max_age) == [refetched.isoformat()]
+
+
+def test_rules_change_recomputes_all_days(connection):
+    shift_store.update_standby_partials(connection, START, END)
+    assert shift_store.update_standby_partials(connection, START, END) == []
+    calendar = compile_rules(DEFAULT_RULES)
+    assert len(shift_store.update_standby_partials(connection, START, END,
+                                                   calendar)) == 60
+
+
+def employee_shift(shift_id, start, end):
+    return {
+        'id': shift_id,
+        'start_timestamp': start,
+        'end_timestamp': end,
+        'schedule': '3115142',
+        'schedule_name': POSITIONS['3115142'],
+        'title': '',
+        'paidtime': 2,
+        'notes': '',
+        'employees': [{
+            'id': 7,
+            'name': 'Employee 0007',
+            'paidtime': 2
+        }]
+    }
+
+
+def test_timezone_shift_date(tmp_path):
+    # 00:30 UTC on 2 January is still 1 January in New York
+    calendar = compile_rules({**DEFAULT_RULES, 'timezone': 'America/New_York'})
+    connection = shift_store.connect(tmp_path / 'shifts.sqlite3')
+    first, second = datetime.date(2024, 1, 1), datetime.date(2024, 1, 2)
+    shift_store.store_shifts(
+        connection, first, second, {}, {
+            'data': [
+                employee_shift(1, '2024-01-01T20:00:00+00:00',
+                               '2024-01-01T22:00:00+00:00')
+            ]
+        })
+    shift_store.update_standby_partials(connection, first, second, calendar)
+
+    # Recomputing 2 January alone must not key its shift on 1 January
+    wait_for_clock()
+    shift_store.store_shifts(
+        connection, second, second, {}, {
+            'data': [
+                employee_shift(2, '2024-01-02T00:30:00+00:00',
+                               '2024-01-02T02:30:00+00:00')
+            ]
+        })
+    assert shift_store.update_standby_partials(connection, first, second,
+                                               calendar) == [second.isoformat()]
+    assert connection.execute(
+        'SELECT date, name, shifts FROM standby_partials ORDER BY date'
+    ).fetchall() == [('2024-01-01', 'Employee 0007', 1),
+                     ('2024-01-02', 'Employee 0007', 1)]
+    report = shift_store.load_standby_report(connection, first, second,
+                                             ['3115142'])
+    assert report['Number_of_shifts'].tolist() == [2]
+    assert shift_store.load_standby_report(
+        connection, second, second, ['3115142'])['Number_of_shifts'].tolist() == [1]
+    connection.close()
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import token_cache
+
+
+@pytest.fixture(autouse=True)
+def memory_only_cache():
+    token_cache.configure(None)
+    yield
+    token_cache._tokens.clear()
+
+
+def test_token_is_fetched_once_until_invalidated():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {'access_token': f'token{len(calls)}', 'expires_in': 3600}
+
+    assert token_cache.get_token('service:a', fetch) == 'token1'
+    assert token_cache.get_token('service:a', fetch) == 'token1'
+    token_cache.invalidate('service:a')
+    assert token_cache.get_token('service:a', fetch) == 'token2'
+    assert len(calls) == 2
+
+
+def test_slow_fetch_blocks_only_its_own_key():
+    release = threading.Event()
+
+    def hanging_fetch():
+        release.wait(5)
+        return {'access_token': 'slow', 'expires_in': 3600}
+
+    slow = threading.Thread(
+        target=token_cache.get_token, args=('service:slow', hanging_fetch))
+    slow.start()
+    try:
+        other = []
+        thread = threading.Thread(target=lambda: other.append(
+            token_cache.get_token('service:fast', lambda: {
+                'access_token': 'fast',
+                'expires_in': 3600
+            })))
+        thread.start()
+        thread.join(2)
+        assert other == ['fast']
+    finally:
+        release.set()
+        slow.join()
+
+
+def test_concurrent_callers_of_one_key_share_a_fetch():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'access_token': 'shared', 'expires_in': 3600}
+
+    tokens = []
+    threads = [
+        threading.Thread(
+            target=lambda: tokens.append(token_cache.get_token('service:a', fetch)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert tokens == ['shared'] * 4
+    assert len(calls) == 1
@@ -0,0 +1,101 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+TIMESHEET_COLUMNS = [
+    'Date', 'Position', 'Start_time', 'End_time', 'Overtime', 'Shift_title',
+    'Notes'
+]
+
+
+def generate_timesheet_report(shift_report: pd.DataFrame) -> pd.DataFrame:
+    '''Build the timesheet rows of all employees, sorted by employee then date
+
+    Args:
+        shift_report (pd.DataFrame): Shift report from generate_shift_report
+
+    Returns:
+        pd.DataFrame: Employee_id, Name and the timesheet columns
+    '''
+    shift_report = shift_report.sort_values(
+        ['Employee_id', 'Name', 'Start_date'], kind='stable')
+    start_dates = pd.to_datetime(shift_report['Start_date'])
+    end_dates = pd.to_datetime(shift_report['End_date'])
+    return pd.DataFrame({
+        'Employee_id': shift_report['Employee_id'].to_numpy(),
+        'Name': shift_report['Name'].to_numpy(),
+        'Date': start_dates.dt.strftime('%Y-%m-%d').to_numpy(),
+        'Position': shift_report['Position'].to_numpy(),
+        'Start_time': start_dates.dt.strftime('%H:%M').to_numpy(),
+        'End_time': end_dates.dt.strftime('%H:%M').to_numpy(),
+        'Overtime': shift_report['Overtime'].round(2).to_numpy(),
+        'Shift_title': shift_report['Title'].to_numpy(),
+        'Notes': shift_report['Notes'].to_numpy()
+    })
+
+
+def _partitions(timesheet_report: pd.DataFrame) -> list[tuple]:
+    '''Return (start, end) row bounds of each employee in the sorted timesheet report'''
+    employee_ids = timesheet_report['Employee_id'].to_numpy()
+    # Employees without an id in the payload are told apart by name
+    names = pd.factorize(timesheet_report['Name'])[0]
+    bounds = np.flatnonzero((np.diff(employee_ids) != 0)
+                            | (np.diff(names) != 0)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(employee_ids)]))
+    return list(zip(starts, ends)) if len(employee_ids) else []
+
+
+def _file_name(name: str, employee_id: int, timeline: str) -> str:
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', str(name)).strip('_')
+    return f'timesheet_{slug}_{employee_id}_{timeline}.csv'
+
+
+def _write_timesheet(path: Path, comment: str, timesheet: pd.DataFrame,
+                     email: str | None) -> tuple:
+    with open(path, 'w') as f:
+        f.write('# ' + comment + '\n')
+        timesheet.to_csv(f, index=False)
+    return path, email
+
+
+def export_timesheets(shift_report: pd.DataFrame,
+                      employees,
+                      output_dir: Path,
+                      timeline: str,
+                      max_workers: int = 4) -> list[tuple]:
+    '''Write one timesheet csv per employee, files are written concurrently
+
+    The shift report is sorted and partitioned once, every employee gets a
+    contiguous slice instead of a filter over the full frame.
+
+    Args:
+        shift_report (pd.DataFrame): Shift report from generate_shift_report
+        employees (Catalog): Employees catalog used to look up emails
+        output_dir (Path): Folder for the timesheet files
+        timeline (str): Period in the start_end form used by report names
+        max_workers (int): Number of concurrent writers
+
+    Returns:
+        list[tuple]: Written file and employee email (None if unknown) of each employee
+    '''
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timesheet_report = generate_timesheet_report(shift_report)
+    period = timeline.replace('_', ' to ')
+
+    jobs = []
+    for start, end in _partitions(timesheet_report):
+        employee_id = int(timesheet_report['Employee_id'].iat[start])
+        name = timesheet_report['Name'].iat[start]
+        employee = employees.get(str(employee_id)) or {}
+        comment = f'Timesheet of {name} ({employee.get("email") or "no email"}) for the time period of {period}'
+        jobs.append((output_dir / _file_name(name, employee_id, timeline),
+                     comment,
+                     timesheet_report.iloc[start:end][TIMESHEET_COLUMNS],
+                     employee.get('email')))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda job: _write_timesheet(*job), jobs))
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+# Refresh tokens this many seconds before they expire
+REFRESH_MARGIN = 120
+# Lifetime assumed when a token response has no expires_in
+DEFAULT_EXPIRES_IN = 300
+
+_tokens: dict = {}
+# Guards _tokens and the file, fetches only hold the lock of their key
+_lock = threading.Lock()
+_key_locks: dict = {}
+_cache_file: Path | None = None
+
+
+def configure(cache_file: Path | None = None) -> None:
+    '''Enable the file-backed cache next to the in-memory one, None keeps tokens in memory only'''
+    global _cache_file
+    with _lock:
+        _cache_file = cache_file
+        if cache_file is not None and cache_file.exists():
+            with open(cache_file) as json_file:
+                _tokens.update(json.load(json_file))
+
+
+def cache_key(service: str, credentials: dict) -> str:
+    '''Return a cache key for the credentials that does not reveal any secret'''
+    digest = hashlib.sha256(
+        json.dumps(credentials, sort_keys=True).encode()).hexdigest()
+    return f'{service}:{digest[:16]}'
+
+
+def _save() -> None:
+    if _cache_file is None:
+        return
+    now = time.time()
+    valid = {
+        key: token
+        for key, token in _tokens.items() if token['expires_at'] > now
+    }
+    # Tokens are credentials, keep the file readable by the owner only
+    descriptor = os.open(_cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+    with os.fdopen(descriptor, 'w') as json_file:
+        json.dump(valid, json_file)
+
+
+def _key_lock(key: str) -> threading.Lock:
+    with _lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def get_token(key: str, fetch: Callable[[], dict | None]) -> str | None:
+    '''Return a cached access token, calling fetch only when it is missing or about to expire
+
+    Args:
+        key (str): Cache key, see cache_key
+        fetch (Callable[[], dict | None]): Returns the token response with access_token and expires_in
+
+    Returns:
+        str | None: Access token, None if fetch failed
+    '''
+    # Callers with the same credentials wait for one fetch, others are not blocked
+    with _key_lock(key):
+        with _lock:
+            token = _tokens.get(key)
+        if token and token['expires_at'] - REFRESH_MARGIN > time.time():
+            return token['access_token']
+
+        response = fetch()
+        if not response or not response.get('access_token'):
+            return None
+        expires_in = float(response.get('expires_in') or DEFAULT_EXPIRES_IN)
+        with _lock:
+            _tokens[key] = {
+                'access_token': response['access_token'],
+                'expires_at': time.time() + expires_in
+            }
+            _save()
+        return response['access_token']
+
+
+def invalidate(key: str) -> None:
+    '''Drop a token, e.g. after the API rejected it'''
+    with _lock:
+        if _tokens.pop(key, None) is not None:
+            _save()